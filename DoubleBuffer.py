@@ -0,0 +1,76 @@
+# Producer/consumer plumbing shared by the pygame front-ends.
+# The simulation (or search) runs on a SimulationThread and publishes snapshots of its state into a
+# DoubleBuffer. The pygame loop on the main thread renders whatever the latest snapshot is at its own frame
+# rate, so drawing never holds up the physics and the physics never waits for a frame.
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DoubleBuffer:
+    """Two preallocated snapshot slots.
+
+    The producer fills the back slot without holding the lock and then swaps it to the front. The consumer
+    holds the lock while it reads the front slot, so the producer can never swap the slot being drawn back
+    out and overwrite it.
+    """
+
+    def __init__(self, front, back, interval=0.0):
+        self._front = front
+        self._back = back
+        self._lock = threading.Lock()
+        self.interval = interval  # Minimum seconds between publishes, 0 to publish every time
+        self.version = 0  # Number of snapshots published
+        self._last_publish = 0.0
+
+    def publish(self, write, force=False):
+        """Calls write(back) to fill the back slot and swaps it to the front.
+
+        Returns False without calling write if the last publish was less than interval seconds ago, unless
+        force is set. Producers that publish every step can use this to only pay for the snapshots that can
+        actually be shown.
+        """
+        now = time.perf_counter()
+        if not force and now - self._last_publish < self.interval:
+            return False
+
+        write(self._back)
+        with self._lock:
+            self._front, self._back = self._back, self._front
+            self.version += 1
+        self._last_publish = now
+        return True
+
+    @contextmanager
+    def front(self):
+        """Read access to the latest snapshot. Don't keep a reference to it after the with block."""
+        with self._lock:
+            yield self._front
+
+
+class SimulationThread(threading.Thread):
+    """Calls step() in a loop until it returns False or stop() is called.
+
+    After every step write is published into buffer. The final state is always published.
+    """
+
+    def __init__(self, step, write, buffer):
+        super().__init__(daemon=True)
+        self.step = step
+        self.write = write
+        self.buffer = buffer
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            more = self.step()
+            if more is False:
+                break
+            self.buffer.publish(self.write)
+        self.buffer.publish(self.write, force=True)
+
+    def stop(self):
+        self._stop_event.set()
+        if self is not threading.current_thread():
+            self.join()
@@ -0,0 +1,220 @@
+# Domain decomposition of the HeatEngine diffusion over several processes.
+# The z planes are split into one slab per worker process, and the grid lives in shared memory so nothing but
+# the commands and a couple of numbers go through the pipes. Every step each worker copies the first and last
+# plane of its slab into a shared halo array, waits for the others, and then steps its slab with HeatEngine
+# using the halos of the slabs above and below. The workers write the lowest and highest temperature of their
+# slab into a shared array, and each of them reduces it to the global spread, so they all stop at the same step
+# once it is below the tolerance.
+#
+# The results are the same as HeatEngine to the last bit. Only z is split, so a 2D grid runs in one slab.
+#
+# Example:
+#   python HeatParallel.py --shape 400 400 400 --workers 1 2 4 8 --steps 10
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from HeatEngine import HeatEngine
+
+
+def slab_worker(conn, names, shape, dtype, bounds, index, barrier):
+    # Worker process: steps planes bounds[index] to bounds[index + 1] - 1 of the shared grid when the driver asks
+    nz, ny, nx = shape
+    slabs = len(bounds) - 1
+    memory = [shared_memory.SharedMemory(name=name) for name in names]
+    grid = np.ndarray((nz + 2, ny + 2, nx + 2), dtype, memory[0].buf)
+    halos = np.ndarray((slabs, 2, ny + 2, nx + 2), dtype, memory[1].buf)
+    extremes = np.ndarray((slabs, 2), np.float64, memory[2].buf)
+    engine = HeatEngine(shape, dtype=dtype, grid=grid)
+    if len(memory) == 4:
+        # The mask is shared as well rather than copied into every worker
+        engine.mask = np.ndarray(grid.shape, bool, memory[3].buf)
+
+    first, last = bounds[index], bounds[index + 1]
+    below = halos[index - 1, 1] if index > 0 else grid[0]
+    above = halos[index + 1, 0] if index < slabs - 1 else grid[-1]
+    while True:
+        command, steps, tol, stats = conn.recv()
+        if command == "stop":
+            break
+
+        history = np.empty((steps, 4)) if stats else None
+        done = 0
+        while True:
+            if tol is not None or done == steps:
+                extremes[index] = engine.extremes(first, last)
+            # Everyone has finished the last step (and written their extremes) past this point
+            barrier.wait()
+            spread = extremes[:, 1].max() - extremes[:, 0].min()
+            if done == steps or (tol is not None and spread < tol):
+                break
+
+            halos[index, 0] = grid[first + 1]
+            halos[index, 1] = grid[last]
+            barrier.wait()
+            engine.step_slab(first, last, below, above, history[done] if stats else None)
+            done += 1
+        conn.send((done, float(spread), history[:done] if stats else None))
+
+    # The arrays must let go of the buffers before they can be closed
+    del engine, grid, halos, extremes, below, above
+    for block in memory:
+        block.close()
+    conn.close()
+
+
+class ParallelHeatEngine:
+    """HeatEngine with the z planes split between worker processes, by default one per core.
+
+    temperatures, mask, seed and dtype are as for HeatEngine. temperatures and layer read the shared grid, which
+    is only safe between calls to run or step. Call close (or use a with block) to free the shared memory.
+    """
+
+    def __init__(self, shape, workers=None, temperatures=None, mask=None, seed=None, dtype=np.float32):
+        shape = tuple(shape)
+        if len(shape) == 2:
+            shape = (1,) + shape
+        if len(shape) != 3:
+            raise ValueError("Shape must be 2D or 3D, not %s" % (shape,))
+        nz, ny, nx = shape
+        workers = max(1, min(workers or os.cpu_count(), nz))
+        self.shape = shape
+        self.workers = workers
+        self.bounds = [k * nz // workers for k in range(workers + 1)]
+
+        self.memory = []
+        grid = self._shared((nz + 2, ny + 2, nx + 2), dtype)
+        self._shared((workers, 2, ny + 2, nx + 2), dtype)
+        self._shared((workers, 2), np.float64)
+        self.engine = HeatEngine(shape, mask=mask, dtype=dtype, grid=grid)
+        if mask is not None:
+            shared_mask = self._shared(grid.shape, bool)
+            shared_mask[...] = self.engine.mask
+            self.engine.mask = shared_mask
+        self.engine.fill(temperatures, seed)
+
+        barrier = mp.Barrier(workers)
+        names = [block.name for block in self.memory]
+        self.conns = []
+        self.processes = []
+        for index in range(workers):
+            parent, child = mp.Pipe()
+            process = mp.Process(target=slab_worker, daemon=True,
+                                 args=(child, names, shape, np.dtype(dtype), self.bounds, index, barrier))
+            process.start()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+        self.time = 0
+        self.last_spread = None
+        self.run(0)
+
+    def _shared(self, shape, dtype):
+        # Zeroed array in a new block of shared memory
+        block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+        self.memory.append(block)
+        array = np.ndarray(shape, dtype, block.buf)
+        array[...] = 0
+        return array
+
+    @property
+    def temperatures(self):
+        return self.engine.temperatures
+
+    def run(self, steps, tol=None, stats=False):
+        """Steps until the spread is below tol, or steps times. Returns the number of steps taken.
+
+        With stats, also returns the statistics of each step taken as in HeatEngine.step.
+        """
+        for conn in self.conns:
+            conn.send(("run", steps, tol, stats))
+        results = [conn.recv() for conn in self.conns]
+        done, self.last_spread, _ = results[0]
+        self.time += done
+        if not stats:
+            return done
+
+        # The statistics of the whole grid from those of the slabs
+        slabs = np.stack([history for _, _, history in results])
+        history = np.empty((done, 4))
+        history[:, 0] = slabs[:, :, 0].min(axis=0)
+        history[:, 1] = slabs[:, :, 1].max(axis=0)
+        history[:, 2] = slabs[:, :, 2].sum(axis=0) / max(self.engine.nodes, 1)
+        history[:, 3] = slabs[:, :, 3].max(axis=0)
+        return done, history
+
+    def step(self, steps=1, stats=False):
+        if stats:
+            return self.run(steps, stats=True)[1]
+        self.run(steps)
+
+    def layer(self, z):
+        return self.engine.layer(z)
+
+    def spread(self):
+        """Highest minus lowest temperature, as reduced by the workers at the end of the last run."""
+        return self.last_spread
+
+    def close(self):
+        if not self.conns:
+            return
+        for conn in self.conns:
+            conn.send(("stop", None, None, None))
+        for process in self.processes:
+            process.join()
+        self.conns = []
+
+        self.engine = None
+        for block in self.memory:
+            block.close()
+            block.unlink()
+        self.memory = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time the heat diffusion split over different numbers of processes.")
+    parser.add_argument("--shape", type=int, nargs="+", default=[200, 200, 200], help="ny nx, or nz ny nx")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count()])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="Compare every run with HeatEngine")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    nodes = int(np.prod(args.shape))
+    expected = None
+    if args.check:
+        expected = HeatEngine(args.shape, seed=args.seed)
+        expected.step(args.steps)
+
+    print("%8s %14s %8s" % ("workers", "updates/s", "speedup"))
+    base = None
+    for workers in args.workers:
+        with ParallelHeatEngine(args.shape, workers, seed=args.seed) as engine:
+            start = time.perf_counter()
+            engine.step(args.steps)
+            elapsed = time.perf_counter() - start
+            if expected is not None and not np.array_equal(engine.temperatures, expected.temperatures):
+                print("Workers %d differ from HeatEngine by up to %g" % (
+                    workers, np.abs(engine.temperatures - expected.temperatures).max()))
+
+        rate = nodes * args.steps / elapsed
+        base = base or rate
+        print("%8d %14.3g %8.2f" % (engine.workers, rate, rate / base))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+# Streams a heat diffusion run to disk for post-processing.
+# Every few steps a snapshot of the temperatures is appended to <path>.npy, and the step, lowest, highest and
+# mean temperature and residual (the largest change of any node in the step) of every step to <path>_stats.npy.
+# Both are plain .npy files, so np.load(..., mmap_mode="r") gives any snapshot without reading the others.
+#
+# The solver thread only copies the temperatures into a free buffer and queues it. A writer thread copies the
+# buffers into the memory mapped file, which doubles in size whenever it is full, and rewrites the header after
+# every append so the file can be read up to the last append while the run is going or after a crash.
+#
+# Example:
+#   python HeatRecorder.py run --shape 100 100 100 --every 10
+#   np.load("run.npy", mmap_mode="r")[k] is then snapshot k, and np.load("run_stats.npy") has every step
+
+import argparse
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from HeatEngine import HeatEngine
+from HeatParallel import ParallelHeatEngine
+
+HEADER_BYTES = 256  # Room for the header of any shape, so it can be rewritten in place as the file grows
+
+STATS = np.dtype([("step", np.int64), ("min", np.float64), ("max", np.float64), ("mean", np.float64),
+                  ("residual", np.float64), ("snapshot", np.int64)])  # snapshot is -1 for steps without one
+
+
+class NpyStream:
+    """A .npy file of shape (count,) + shape that rows are appended to through a memory map."""
+
+    def __init__(self, path, shape, dtype, capacity=16):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.count = 0
+        self.capacity = 0
+        self.map = None
+        self.file = open(path, "w+b")
+        self.resize(capacity)
+        self.write_header()
+
+    def write_header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(self.dtype), (self.count,) + self.shape)
+        # Version 1.0: magic string, version, header length and the header padded with spaces to HEADER_BYTES
+        header = header.ljust(HEADER_BYTES - 11) + "\n"
+        self.file.seek(0)
+        self.file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+        self.file.flush()
+
+    def resize(self, capacity):
+        if self.map is not None:
+            self.map.flush()
+            self.map = None
+        self.capacity = capacity
+        self.file.truncate(HEADER_BYTES + capacity * self.row_bytes)
+        if capacity:
+            self.map = np.memmap(self.file, self.dtype, "r+", HEADER_BYTES, (capacity,) + self.shape)
+
+    def append(self, row):
+        if self.count == self.capacity:
+            self.resize(max(2 * self.capacity, 1))
+        self.map[self.count] = row
+        self.count += 1
+        self.write_header()
+
+    def close(self):
+        # Down to just the rows that were written
+        self.resize(self.count)
+        self.map = None
+        self.write_header()
+        self.file.close()
+
+
+def initial_stats(temperatures):
+    """Lowest, highest and mean temperature of a grid with no mask, and no residual, for the record of step 0."""
+    return temperatures.min(), temperatures.max(), temperatures.mean(dtype=np.float64), np.nan
+
+
+class HeatRecorder:
+    """Writes the snapshots of every every-th step and the stats of every step of a run, see the top of the file.
+
+    buffers is the number of snapshots that can be waiting for the writer thread. If they are all in use, record
+    waits for one rather than dropping the snapshot.
+    """
+
+    def __init__(self, path, shape, every=10, dtype=np.float32, buffers=3):
+        self.every = every
+        self.fields = NpyStream(path + ".npy", shape, dtype)
+        self.stats = NpyStream(path + "_stats.npy", (), STATS)
+        self.snapshots = 0
+        self.waited = 0.0  # Seconds record spent waiting for a free buffer
+
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty(shape, dtype))
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.write, daemon=True)
+        self.thread.start()
+
+    def record(self, step, temperatures, stats):
+        """stats is the lowest, highest and mean temperature and the residual after step."""
+        if self.error is not None:
+            raise self.error
+        snapshot = -1
+        if step % self.every == 0:
+            start = time.perf_counter()
+            buffer = self.free.get()
+            self.waited += time.perf_counter() - start
+            buffer[...] = temperatures
+            snapshot = self.snapshots
+            self.snapshots += 1
+            self.queue.put(("field", buffer))
+        self.queue.put(("stats", (step,) + tuple(stats) + (snapshot,)))
+
+    def write(self):
+        # Writer thread: appends whatever is queued until it gets None
+        while True:
+            kind, item = self.queue.get()
+            if kind is None:
+                return
+            try:
+                if self.error is None:
+                    if kind == "field":
+                        self.fields.append(item)
+                    else:
+                        self.stats.append(item)
+            except Exception as error:
+                # Raised on the solver thread at the next record or close, the buffers keep coming back so it
+                # never waits forever
+                self.error = error
+            if kind == "field":
+                self.free.put(item)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put((None, None))
+        self.thread.join()
+        self.thread = None
+        self.fields.close()
+        self.stats.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_run(path):
+    """The snapshots of a recorded run, memory mapped, and the stats of every step."""
+    return np.load(path + ".npy", mmap_mode="r"), np.load(path + "_stats.npy")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the heat diffusion to equilibrium and record it.")
+    parser.add_argument("path", help="Output path without the extension")
+    parser.add_argument("--shape", type=int, nargs="+", default=[100, 100, 100], help="ny nx, or nz ny nx")
+    parser.add_argument("--every", type=int, default=10, help="Steps between snapshots")
+    parser.add_argument("--tol", type=float, default=10, help="Stop once the spread is below this")
+    parser.add_argument("--max-steps", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, see HeatParallel")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers == 1:
+        engine = HeatEngine(args.shape, seed=args.seed)
+    else:
+        engine = ParallelHeatEngine(args.shape, args.workers, seed=args.seed)
+
+    start = time.perf_counter()
+    in_record = 0.0
+    with HeatRecorder(args.path, engine.temperatures.shape, args.every) as recorder:
+        recorder.record(0, engine.temperatures, initial_stats(engine.temperatures))
+        while engine.time < args.max_steps:
+            stats = engine.step(stats=True)[0]
+            begin = time.perf_counter()
+            recorder.record(engine.time, engine.temperatures, stats)
+            in_record += time.perf_counter() - begin
+            if stats[1] - stats[0] < args.tol:
+                break
+        solved = time.perf_counter() - start
+    if args.workers != 1:
+        engine.close()
+
+    fields, stats = load_run(args.path)
+    print("%d steps in %.2f s, %.2f s of it in record (%.2f s waiting for the writer)"
+          % (engine.time, solved, in_record, recorder.waited))
+    print("%d snapshots of %s, %.1f MB" % (len(fields), fields.shape[1:], os.path.getsize(args.path + ".npy") / 2 ** 20))
+    print("Last step: min %.2f, max %.2f, mean %.2f, residual %.3g"
+          % (stats[-1]["min"], stats[-1]["max"], stats[-1]["mean"], stats[-1]["residual"]))
+
+
+if __name__ == '__main__':
+    main()
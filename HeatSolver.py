@@ -0,0 +1,280 @@
+# Steady state solver for the heat diffusion of TemperatureEquilibrium.
+# At the steady state every free node is the average of its neighbours, i.e. count * T - sum(neighbours) = 0.
+# Nodes marked as fixed (heaters, coolers) keep their temperature. With no fixed nodes every constant is a
+# steady state, and the diffusion ends at the one with the same count weighted mean as the start, so the
+# solution is shifted to it at the end.
+#
+# Methods:
+#   jacobi        the same halfway to the average step as HeatEngine, for comparison
+#   gauss_seidel  red-black Gauss-Seidel, all the red nodes then all the black ones
+#   sor           red-black successive over-relaxation
+#   multigrid     V cycles over grids coarsened by summing 2 x 2 (x 2) blocks, smoothed with red-black
+#                 Gauss-Seidel. Each coarse correction is scaled to the step that lowers the error the most.
+#
+# The residual is the largest difference between a free node and the average of its neighbours, in the same
+# units as the temperatures.
+#
+# Example:
+#   python HeatSolver.py --shape 256 256 --tol 0.01
+
+import argparse
+import time
+import numpy as np
+
+METHODS = ("jacobi", "gauss_seidel", "sor", "multigrid")
+COARSEST = 512  # Grids with at most this many nodes are solved directly
+
+
+def _block_sum(a, factors):
+    # Sums a over blocks of the given size along each axis, padding the ends with zeros
+    pad = [(0, -n % f) for n, f in zip(a.shape, factors)]
+    a = np.pad(a, pad)
+    shape = []
+    for n, f in zip(a.shape, factors):
+        shape += [n // f, f]
+    return a.reshape(shape).sum(axis=(1, 3, 5))
+
+
+def _unit_neighbour_sum(x):
+    # Sum of the up to 6 neighbours of every node, with nothing beyond the edges
+    s = np.zeros_like(x)
+    s[1:] += x[:-1]
+    s[:-1] += x[1:]
+    s[:, 1:] += x[:, :-1]
+    s[:, :-1] += x[:, 1:]
+    s[:, :, 1:] += x[:, :, :-1]
+    s[:, :, :-1] += x[:, :, 1:]
+    return s
+
+
+class Level:
+    """The operator A x = diag * x - weighted sum of the neighbours, on one grid of the multigrid hierarchy.
+
+    weights[axis] holds the weight of the link between each node and the next one along that axis, and ground
+    the weight of links to fixed nodes, which only add to the diagonal. Nodes with no links are left out.
+    """
+
+    def __init__(self, weights, ground):
+        self.weights = weights
+        self.ground = ground
+        self.shape = ground.shape
+
+        wz, wy, wx = weights
+        diag = ground.copy()
+        diag[1:] += wz
+        diag[:-1] += wz
+        diag[:, 1:] += wy
+        diag[:, :-1] += wy
+        diag[:, :, 1:] += wx
+        diag[:, :, :-1] += wx
+        self.diag = diag
+        self.active = diag > 0
+        self.inverse_diag = np.divide(1, diag, out=np.zeros_like(diag), where=self.active)
+
+        parity = np.indices(self.shape).sum(axis=0) % 2
+        self.colours = [(parity == 0) & self.active, (parity == 1) & self.active]
+        self.exact = None  # Pseudo inverse of A on the active nodes, for the coarsest grid
+
+    def neighbour_sum(self, x):
+        wz, wy, wx = self.weights
+        s = np.zeros_like(x)
+        s[1:] += wz * x[:-1]
+        s[:-1] += wz * x[1:]
+        s[:, 1:] += wy * x[:, :-1]
+        s[:, :-1] += wy * x[:, 1:]
+        s[:, :, 1:] += wx * x[:, :, :-1]
+        s[:, :, :-1] += wx * x[:, :, 1:]
+        return s
+
+    def apply(self, x):
+        return self.diag * x - self.neighbour_sum(x)
+
+    def residual(self, x, b):
+        r = b - self.apply(x)
+        r[~self.active] = 0
+        return r
+
+    def jacobi(self, x, b):
+        # Halfway to the average of the neighbours, like HeatEngine
+        target = (b + self.neighbour_sum(x)) * self.inverse_diag
+        np.copyto(x, (x + target) / 2, where=self.active)
+
+    def smooth(self, x, b, sweeps=1, omega=1.0):
+        """Red-black Gauss-Seidel sweeps, over-relaxed by omega."""
+        for _ in range(sweeps):
+            for colour in self.colours:
+                target = (b + self.neighbour_sum(x)) * self.inverse_diag
+                if omega != 1.0:
+                    target = (1 - omega) * x + omega * target
+                np.copyto(x, target, where=colour)
+
+    def factors(self):
+        return tuple(2 if n > 1 else 1 for n in self.shape)
+
+    def coarsen(self):
+        """The next grid down: each block of nodes becomes one node, with the links between blocks summed."""
+        factors = self.factors()
+        ground = _block_sum(self.ground, factors)
+        weights = []
+        for axis, w in enumerate(self.weights):
+            if factors[axis] == 2:
+                # Only the links from odd to even positions cross from one block to the next
+                w = np.take(w, range(1, w.shape[axis], 2), axis=axis)
+            axis_factors = tuple(1 if i == axis else f for i, f in enumerate(factors))
+            weights.append(_block_sum(w, axis_factors))
+        return Level(weights, ground)
+
+    def solve_exact(self, b):
+        if self.exact is None:
+            n = self.active.sum()
+            index = np.flatnonzero(self.active)
+            matrix = np.empty((n, n))
+            for k, i in enumerate(index):
+                unit = np.zeros(self.shape)
+                unit.flat[i] = 1
+                matrix[:, k] = self.apply(unit).flat[index]
+            self.exact = index, np.linalg.pinv(matrix)
+        index, inverse = self.exact
+        x = np.zeros(self.shape)
+        x.flat[index] = inverse @ b.flat[index]
+        return x
+
+
+def build_levels(fine):
+    levels = [fine]
+    while levels[-1].active.sum() > COARSEST and max(levels[-1].shape) > 1:
+        levels.append(levels[-1].coarsen())
+    return levels
+
+
+def v_cycle(levels, k, x, b, sweeps=2):
+    level = levels[k]
+    if k == len(levels) - 1:
+        np.copyto(x, level.solve_exact(b), where=level.active)
+        return
+
+    level.smooth(x, b, sweeps)
+    r = level.residual(x, b)
+    error = np.zeros(levels[k + 1].shape)
+    v_cycle(levels, k + 1, error, _block_sum(r, level.factors()), sweeps)
+
+    # Back up to this grid, each node takes the correction of its block
+    for axis, f in enumerate(level.factors()):
+        error = np.repeat(error, f, axis=axis)
+    correction = error[:level.shape[0], :level.shape[1], :level.shape[2]] * level.active
+
+    # Piecewise constant corrections are too small, step to the minimum of the error along the correction
+    curvature = np.vdot(correction, level.apply(correction))
+    if curvature > 0:
+        x += np.vdot(r, correction) / curvature * correction
+    level.smooth(x, b, sweeps)
+
+
+class SolveResult:
+    """The outcome of a solve. residuals holds the residual after each iteration."""
+
+    def __init__(self, temperatures, method, residuals, seconds, converged):
+        self.temperatures = temperatures
+        self.method = method
+        self.residuals = residuals
+        self.iterations = len(residuals)
+        self.seconds = seconds
+        self.converged = converged
+
+    @property
+    def iterations_per_second(self):
+        return self.iterations / self.seconds if self.seconds > 0 else float("inf")
+
+    def __repr__(self):
+        return "SolveResult(method=%s, iterations=%d, residual=%.3g, converged=%s, %.1f iterations/s)" % (
+            self.method, self.iterations, self.residuals[-1] if self.residuals else float("nan"), self.converged,
+            self.iterations_per_second)
+
+
+def default_omega(shape):
+    # Close to the best over-relaxation for a Laplacian on a grid this size
+    return 2 / (1 + np.sin(np.pi / max(shape)))
+
+
+def solve(temperatures, method="multigrid", tol=0.01, max_iterations=10000, fixed=None, omega=None):
+    """Runs the diffusion of a (ny, nx) or (nz, ny, nx) grid to its steady state.
+
+    Stops once the residual is below tol, or after max_iterations. fixed marks the nodes that keep their
+    temperature. omega is the over-relaxation of sor, chosen from the grid size by default.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown method %r, expected one of %s" % (method, ", ".join(METHODS)))
+    temperatures = np.asarray(temperatures, dtype=float)
+    shape = temperatures.shape
+    x = temperatures.reshape((1,) * (3 - temperatures.ndim) + shape).copy()
+
+    fixed = np.zeros(x.shape, dtype=bool) if fixed is None else np.reshape(fixed, x.shape).astype(bool)
+    free = ~fixed
+    weights = [(free[:-1] & free[1:]).astype(float),
+               (free[:, :-1] & free[:, 1:]).astype(float),
+               (free[:, :, :-1] & free[:, :, 1:]).astype(float)]
+    fine = Level(weights, _unit_neighbour_sum(fixed.astype(float)) * free)
+    b = _unit_neighbour_sum(np.where(fixed, x, 0)) * free
+    levels = build_levels(fine) if method == "multigrid" else [fine]
+    if method == "sor" and omega is None:
+        omega = default_omega(x.shape)
+
+    residuals = []
+    converged = False
+    start = time.perf_counter()
+    for _ in range(max_iterations):
+        if method == "jacobi":
+            fine.jacobi(x, b)
+        elif method == "gauss_seidel":
+            fine.smooth(x, b)
+        elif method == "sor":
+            fine.smooth(x, b, omega=omega)
+        else:
+            v_cycle(levels, 0, x, b)
+
+        residuals.append(float(np.abs(fine.residual(x, b) * fine.inverse_diag).max()))
+        if residuals[-1] < tol:
+            converged = True
+            break
+    seconds = time.perf_counter() - start
+
+    if not fixed.any() and fine.active.any():
+        # Back to the count weighted mean the diffusion keeps
+        count = fine.diag
+        x += np.vdot(count, temperatures.reshape(x.shape) - x) / count.sum()
+
+    return SolveResult(x.reshape(shape), method, residuals, seconds, converged)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the steady state solvers on a random grid.")
+    parser.add_argument("--shape", type=int, nargs="+", default=[128, 128], help="ny nx, or nz ny nx")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+    parser.add_argument("--tol", type=float, default=0.01)
+    parser.add_argument("--max-iterations", type=int, default=20000)
+    parser.add_argument("--hot-edge", action="store_true", help="Hold the first row at 255 and the last at 0")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    temperatures = rng.integers(0, 256, args.shape).astype(float)
+    fixed = None
+    if args.hot_edge:
+        fixed = np.zeros(args.shape, dtype=bool)
+        fixed[..., 0, :] = fixed[..., -1, :] = True
+        temperatures[..., 0, :] = 255
+        temperatures[..., -1, :] = 0
+
+    for method in args.methods:
+        result = solve(temperatures, method, args.tol, args.max_iterations, fixed)
+        print(result)
+        history = result.residuals
+        marks = sorted({0, len(history) // 4, len(history) // 2, len(history) - 1})
+        print("  residuals: " + ", ".join("%d: %.3g" % (i + 1, history[i]) for i in marks))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Headless batch runs of the Ising model.
+# Every combination of temperature, lattice size, sweep count and seed is an independent Markov chain, so the
+# chains are farmed out to a pool of processes and the averaged observables are written to a CSV file.
+#
+# Example:
+#   python IsingBatch.py --temps 1.5 2.0 2.27 2.5 3.0 --sizes 32 64 --sweeps 5000 --seeds 1 2 3 -o ising.csv
+#
+# With --checkpoint-dir every chain saves its state every --checkpoint-every sweeps. Running the same command
+# again with --resume picks each chain up from its last checkpoint, so a preempted job loses at most one
+# checkpoint interval.
+
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from IsingEngine import CheckerboardEngine, save_checkpoint, load_checkpoint
+
+FIELDS = ["temp", "rows", "sweeps", "seed", "energy", "magnetisation", "specific_heat", "susceptibility"]
+
+
+def summarise(temp, rows, sweeps, seed, energies, magnetisations):
+    """Averages per spin from the total energy and magnetisation measured after every sweep."""
+    n = rows * rows
+    abs_m = np.abs(magnetisations)
+    return {
+        "temp": temp,
+        "rows": rows,
+        "sweeps": sweeps,
+        "seed": seed,
+        "energy": energies.mean() / n,
+        "magnetisation": abs_m.mean() / n,
+        "specific_heat": energies.var() / (n * temp**2),
+        "susceptibility": (np.mean(magnetisations**2) - abs_m.mean()**2) / (n * temp),
+    }
+
+
+def checkpoint_path(checkpoint_dir, temp, rows, sweeps, seed):
+    return os.path.join(checkpoint_dir, "ising_T%g_L%d_S%d_seed%d.npz" % (temp, rows, sweeps, seed))
+
+
+def run_chain(temp, rows, sweeps, seed, burn_in, checkpoint_dir=None, checkpoint_every=1000, resume=False):
+    engine = CheckerboardEngine(rows, temp, seed=seed)
+    energies = np.empty(sweeps)
+    magnetisations = np.empty(sweeps)
+    done = 0  # Sweeps finished, including the burn in
+
+    path = None
+    if checkpoint_dir is not None:
+        path = checkpoint_path(checkpoint_dir, temp, rows, sweeps, seed)
+        if resume and os.path.exists(path):
+            extras = load_checkpoint(engine, path)
+            done = int(extras["done"])
+            energies[:] = extras["energies"]
+            magnetisations[:] = extras["magnetisations"]
+
+    while done < burn_in + sweeps:
+        engine.sweep()
+        if done >= burn_in:
+            energies[done - burn_in] = engine.energy()
+            magnetisations[done - burn_in] = engine.magnetisation()
+        done += 1
+
+        if path is not None and (done % checkpoint_every == 0 or done == burn_in + sweeps):
+            save_checkpoint(engine, path, done=done, energies=energies, magnetisations=magnetisations)
+
+    return summarise(temp, rows, sweeps, seed, energies, magnetisations)
+
+
+def run_batch(temps, sizes, sweeps, seeds, burn_in=200, workers=None, checkpoint_dir=None, checkpoint_every=1000,
+              resume=False):
+    """Runs one chain for every (temp, rows, sweeps, seed) combination and returns their summaries in order."""
+    jobs = list(itertools.product(temps, sizes, sweeps, seeds))
+    # Start the longest chains first so no worker is left with a big one at the end
+    order = sorted(range(len(jobs)), key=lambda k: -jobs[k][1]**2 * jobs[k][2])
+
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {k: pool.submit(run_chain, *jobs[k], burn_in, checkpoint_dir, checkpoint_every, resume)
+                   for k in order}
+        for k, future in futures.items():
+            results[k] = future.result()
+    return results
+
+
+def write_results(results, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run independent Ising chains in a process pool.")
+    parser.add_argument("--temps", type=float, nargs="+", required=True)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64], help="Number of rows (must be even)")
+    parser.add_argument("--sweeps", type=int, nargs="+", default=[1000], help="Measured sweeps per chain")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--burn-in", type=int, default=200, help="Sweeps discarded before measuring")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("-o", "--output", default="ising_results.csv")
+    parser.add_argument("--checkpoint-dir", help="Directory to save a checkpoint of every chain in")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="Sweeps between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Carry on from the checkpoints in --checkpoint-dir")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.resume and args.checkpoint_dir is None:
+        raise SystemExit("--resume needs --checkpoint-dir")
+    if args.checkpoint_dir is not None:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    results = run_batch(args.temps, args.sizes, args.sweeps, args.seeds, args.burn_in, args.workers,
+                        args.checkpoint_dir, args.checkpoint_every, args.resume)
+    write_results(results, args.output)
+    print("Wrote %d chains to %s" % (len(results), args.output))
+
+
+if __name__ == '__main__':
+    main()
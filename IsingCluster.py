@@ -0,0 +1,173 @@
+# Cluster updates for the Ising model near the critical temperature.
+# Single spin Metropolis suffers from critical slowing down around Tc = 2/ln(1 + sqrt(2)) ~ 2.269, where
+# successive configurations stay correlated for a very long time. Wolff and Swendsen-Wang flip whole clusters
+# of aligned spins at once, built by activating bonds between equal neighbours with p = 1 - exp(-2J/T).
+# Both engines work on the same int8 spin array as IsingEngine, so a lattice can be handed between them.
+
+import time
+import numpy as np
+
+from IsingEngine import J, Engine, CheckerboardEngine
+
+TC = 2 / np.log(1 + np.sqrt(2))
+
+
+class WolffEngine(Engine):
+    """Grows and flips one cluster from a random seed site per step."""
+
+    def __init__(self, rows, temp, seed=None, spins=None, clusters_per_sweep=1):
+        super().__init__(rows, temp, seed, spins)
+        self.clusters_per_sweep = clusters_per_sweep
+
+    def step(self):
+        s = self.spins.reshape(-1)
+        p_add = 1 - np.exp(-2 * J / self.temp)
+
+        first = self.rng.integers(s.size)
+        cluster_spin = s[first]
+        in_cluster = np.zeros(s.size, dtype=bool)
+        in_cluster[first] = True
+        frontier = np.array([first])
+
+        # Breadth first growth, one layer of the cluster at a time. Every bond from a new cluster site is
+        # tested exactly once, when that site is in the frontier.
+        while frontier.size:
+            candidates = self.lattice.neighbours(frontier).ravel()
+            candidates = candidates[(s[candidates] == cluster_spin) & ~in_cluster[candidates]]
+            candidates = candidates[self.rng.random(candidates.size) < p_add]
+            frontier = np.unique(candidates)
+            in_cluster[frontier] = True
+
+        if self.observables is not None:
+            # Only the bonds on the edge of the cluster change, from s_i*s_j to -s_i*s_j
+            sites = np.flatnonzero(in_cluster)
+            outside = self.lattice.neighbours(sites)
+            edge = np.sum(s[outside] * ~in_cluster[outside], dtype=np.int64)
+            self.observables.flip(2 * J * int(cluster_spin) * int(edge), -2 * int(cluster_spin) * sites.size)
+
+        s[in_cluster] *= -1
+        size = int(np.count_nonzero(in_cluster))
+        self.total_steps += size
+        if self.observables is not None:
+            self.observables.advance(self.total_steps)
+        return size
+
+    def sweep(self, sweeps=1):
+        """Flips sweeps*clusters_per_sweep clusters.
+
+        The number of flips must not depend on the cluster sizes (e.g. flipping until rows*rows spins have
+        turned over), otherwise the configurations seen after each sweep are biased toward large clusters.
+        """
+        for _ in range(sweeps * self.clusters_per_sweep):
+            self.step()
+        return self.spins
+
+
+def label_clusters(n, a, b):
+    """Root label of every site after joining each pair (a[k], b[k]).
+
+    Vectorised union find: every pass hooks the larger root of each unjoined pair onto the smaller one and
+    then pointer jumps until every site points straight at its root.
+    """
+    parent = np.arange(n)
+    while True:
+        pa = parent[a]
+        pb = parent[b]
+        differ = pa != pb
+        if not differ.any():
+            return parent
+
+        np.minimum.at(parent, np.maximum(pa[differ], pb[differ]), np.minimum(pa[differ], pb[differ]))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+class SwendsenWangEngine(Engine):
+    """Splits the whole lattice into clusters every step and flips each with probability 1/2."""
+
+    def step(self):
+        s = self.spins
+        p_add = 1 - np.exp(-2 * J / self.temp)
+
+        # Only the DOWN and RIGHT bonds, so each bond is tested once
+        down = (s == np.roll(s, -1, 0)) & (self.rng.random(s.shape) < p_add)
+        right = (s == np.roll(s, -1, 1)) & (self.rng.random(s.shape) < p_add)
+        down = np.flatnonzero(down)
+        right = np.flatnonzero(right)
+        sites = np.concatenate([down, right])
+        partners = np.concatenate([self.lattice.neighbours(down)[0], self.lattice.neighbours(right)[2]])
+        roots = label_clusters(s.size, sites, partners)
+
+        flip = self.rng.random(s.size) < 0.5
+        s.reshape(-1)[flip[roots]] *= -1
+        self.total_steps += s.size
+        if self.observables is not None:
+            # Every site may have changed, so there is nothing to gain over a recount
+            self.observables.resync(self.spins)
+            self.observables.advance(self.total_steps)
+        return self.spins
+
+    def sweep(self, sweeps=1):
+        for _ in range(sweeps):
+            self.step()
+        return self.spins
+
+
+def autocorrelation(series):
+    """Normalised autocorrelation function of a time series, worked out with an FFT."""
+    x = np.asarray(series, dtype=float)
+    x = x - x.mean()
+    n = x.size
+    f = np.fft.rfft(x, 2 * n)
+    acf = np.fft.irfft(f * np.conjugate(f))[:n]
+    if acf[0] == 0:
+        return np.ones(n)
+    return acf / acf[0]
+
+
+def integrated_autocorrelation_time(series, c=5):
+    """tau_int = 1/2 + sum rho(t), summed up to the first window W >= c*tau_int(W) (Sokal's automatic window).
+
+    A series of n samples holds roughly n / (2*tau_int) independent samples.
+    """
+    rho = autocorrelation(series)
+    taus = 0.5 + np.cumsum(rho[1:])
+    for w, tau in enumerate(taus, start=1):
+        if w >= c * tau:
+            return tau
+    return taus[-1]
+
+
+def measure(engine, samples, step):
+    """Runs step() samples times and returns |M| after every step, the tau_int of that and the run time."""
+    series = np.empty(samples)
+    start = time.perf_counter()
+    for k in range(samples):
+        step()
+        series[k] = abs(engine.magnetisation())
+    elapsed = time.perf_counter() - start
+    return series, integrated_autocorrelation_time(series), elapsed
+
+
+def main():
+    rows = 64
+    samples = 2000
+    burn_in = 200
+
+    runs = [
+        ("Metropolis", CheckerboardEngine(rows, TC, seed=1)),
+        ("Wolff", WolffEngine(rows, TC, seed=1)),
+        ("Swendsen-Wang", SwendsenWangEngine(rows, TC, seed=1)),
+    ]
+    for name, engine in runs:
+        engine.sweep(burn_in)
+        series, tau, elapsed = measure(engine, samples, engine.sweep)
+        effective = samples / (2 * tau) / elapsed
+        print("%-14s tau_int = %8.2f steps   effective samples per second = %8.1f" % (name, tau, effective))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+# Headless engine for the 2D Ising model.
+# The spins are held in a NumPy int8 array with periodic boundaries. The lattice is split into two
+# checkerboard sub lattices ("black" and "white"); no two sites of the same colour are neighbours, so every
+# site of one colour can be updated at the same time with array operations.
+
+import json
+import os
+import time
+import numpy as np
+
+J = 1  # Coupling constant between neighbouring spins
+
+
+def random_spins(rows, rng):
+    """Returns a rows x rows int8 array of randomly orientated spins (+1 or -1)."""
+    return rng.integers(0, 2, (rows, rows), dtype=np.int8) * np.int8(2) - np.int8(1)
+
+
+def neighbour_sum(spins):
+    """Sum of the 4 nearest neighbour spins of every site, with periodic boundaries."""
+    return np.roll(spins, 1, 0) + np.roll(spins, -1, 0) + np.roll(spins, 1, 1) + np.roll(spins, -1, 1)
+
+
+def total_energy(spins):
+    # Each bond is only counted once by looking DOWN and RIGHT
+    return int(-J * np.sum(spins * (np.roll(spins, -1, 0) + np.roll(spins, -1, 1)), dtype=np.int64))
+
+
+def total_magnetisation(spins):
+    return int(np.sum(spins, dtype=np.int64))
+
+
+def acceptance_table(temp):
+    """Metropolis acceptance probability indexed by s*h + 4.
+
+    s*h (a spin times the sum of its 4 neighbours) can only be -4, -2, 0, 2 or 4, so the Boltzmann factor
+    exp(-2*J*s*h/T) only needs to be worked out once per temperature.
+    """
+    sh = np.arange(-4, 5)
+    return np.minimum(1.0, np.exp(-2 * J * sh / temp))
+
+
+class Lattice:
+    """A rows x rows periodic lattice stored as one int8 spin per site.
+
+    Sites are numbered row*rows + col. Rather than a neighbour list per site, the lattice keeps the next and
+    previous index along one axis (2*rows numbers), which is all that is needed to find the neighbours of any
+    site with periodic boundaries.
+    """
+
+    def __init__(self, rows, spins=None, rng=None):
+        self.rows = rows
+        if spins is None:
+            self.spins = random_spins(rows, rng if rng is not None else np.random.default_rng())
+        else:
+            self.spins = np.ascontiguousarray(spins, dtype=np.int8)
+            if self.spins.shape != (rows, rows):
+                raise ValueError("Expected a %d x %d spin array, got %s" % (rows, rows, self.spins.shape))
+
+        index = np.arange(rows, dtype=np.int64)
+        self.next = np.roll(index, -1)
+        self.prev = np.roll(index, 1)
+
+    @property
+    def size(self):
+        return self.spins.size
+
+    def neighbours(self, sites):
+        """Flat indices of the DOWN, UP, RIGHT and LEFT neighbours of each site, shape (4, len(sites))."""
+        row, col = np.divmod(np.asarray(sites, dtype=np.int64), self.rows)
+        return np.stack([
+            self.next[row] * self.rows + col,
+            self.prev[row] * self.rows + col,
+            row * self.rows + self.next[col],
+            row * self.rows + self.prev[col],
+        ])
+
+
+class Observables:
+    """Running totals of the energy and magnetisation of a lattice.
+
+    The engines add the change from every accepted flip, so the totals are never recounted. Every stride steps
+    the totals are sampled into ring buffers holding the last capacity samples.
+    """
+
+    def __init__(self, spins, stride=1, capacity=10000):
+        self.stride = stride
+        self.capacity = capacity
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.energies = np.zeros(capacity, dtype=np.int64)
+        self.magnetisations = np.zeros(capacity, dtype=np.int64)
+        self.count = 0  # Number of samples taken, including those overwritten in the ring buffer
+        self.next_sample = 0
+        self.resync(spins)
+
+    def resync(self, spins):
+        """Recounts the totals from the spins, e.g. after the lattice was changed outside an engine."""
+        self.energy = total_energy(spins)
+        self.magnetisation = total_magnetisation(spins)
+
+    def flip(self, delta_e, delta_m):
+        self.energy += delta_e
+        self.magnetisation += delta_m
+
+    def advance(self, step):
+        """Takes a sample if step has reached the next multiple of stride."""
+        if step >= self.next_sample:
+            k = self.count % self.capacity
+            self.steps[k] = step
+            self.energies[k] = self.energy
+            self.magnetisations[k] = self.magnetisation
+            self.count += 1
+            self.next_sample = (step // self.stride + 1) * self.stride
+
+    def steps_to_next_sample(self, step):
+        return max(self.next_sample - step, 1)
+
+    def series(self):
+        """Returns (steps, energies, magnetisations) of the samples still in the buffer, oldest first."""
+        n = min(self.count, self.capacity)
+        order = (np.arange(n) + self.count - n) % self.capacity
+        return self.steps[order], self.energies[order], self.magnetisations[order]
+
+
+class Engine:
+    """State shared by the Ising engines: the lattice, temperature, random generator and step counter."""
+
+    def __init__(self, rows, temp, seed=None, spins=None):
+        self.rows = rows
+        self.rng = np.random.default_rng(seed)
+        self.total_steps = 0  # Number of attempted single spin flips
+        self.observables = None
+
+        self.lattice = Lattice(rows, spins, self.rng)
+        self.spins = self.lattice.spins
+        self.temp = temp
+
+    @property
+    def temp(self):
+        return self._temp
+
+    @temp.setter
+    def temp(self, temp):
+        # Rebuild the acceptance table whenever the temperature changes
+        self._temp = temp
+        self.table = acceptance_table(temp)
+
+    def track(self, stride=None, capacity=10000):
+        """Starts keeping running totals of the energy and magnetisation, sampled every stride steps.
+
+        The stride defaults to one sweep.
+        """
+        if stride is None:
+            stride = self.spins.size
+        self.observables = Observables(self.spins, stride, capacity)
+        self.observables.advance(self.total_steps)
+        return self.observables
+
+    def energy(self):
+        if self.observables is not None:
+            return self.observables.energy
+        return total_energy(self.spins)
+
+    def magnetisation(self):
+        if self.observables is not None:
+            return self.observables.magnetisation
+        return total_magnetisation(self.spins)
+
+
+class CheckerboardEngine(Engine):
+    """Metropolis sweeps that update all the black sites and then all the white sites at once."""
+
+    def __init__(self, rows, temp, seed=None, spins=None):
+        if rows % 2 != 0:
+            # An odd periodic lattice has neighbouring sites of the same colour across the boundary
+            raise ValueError("The checkerboard update needs an even number of rows, got %d" % rows)
+        super().__init__(rows, temp, seed, spins)
+
+        even = np.arange(rows) % 2 == 0
+        self.black = even[:, None] == even[None, :]
+        self.white = ~self.black
+
+    def update_sublattice(self, mask):
+        s = self.spins
+        # Energy change of flipping each spin is 2*J*s*h where h is the sum of its neighbours
+        sh = s * neighbour_sum(s)
+        flip = mask & (self.rng.random(s.shape) < self.table[sh + 4])
+        if self.observables is not None:
+            # No two flipped sites are neighbours, so the energy changes of the flips simply add up
+            self.observables.flip(2 * J * int(np.sum(sh[flip], dtype=np.int64)),
+                                  -2 * int(np.sum(s[flip], dtype=np.int64)))
+        s[flip] *= -1
+
+    def sweep(self, sweeps=1):
+        """One sweep attempts a flip of every spin on the lattice once."""
+        for _ in range(sweeps):
+            self.update_sublattice(self.black)
+            self.update_sublattice(self.white)
+            self.total_steps += self.spins.size
+            if self.observables is not None:
+                self.observables.advance(self.total_steps)
+        return self.spins
+
+
+class RandomSiteEngine(Engine):
+    """Single spin Metropolis at randomly chosen sites, the same dynamics as IsingModel.monte_carlo.
+
+    The site indices and uniforms are drawn from the generator in large blocks and the acceptance probability
+    is looked up in the table, so each step is a few list look ups rather than three calls into random and a
+    call to math.e**. The flips go straight into the spin array through a memoryview, and the neighbours are
+    worked out from the row and column of each site with lists of rows entries, so nothing is kept per site
+    beyond the spin itself.
+    """
+
+    def __init__(self, rows, temp, seed=None, spins=None, block_size=1 << 16):
+        super().__init__(rows, temp, seed, spins)
+        self.block_size = block_size
+        # Flat index of the start of the row below and above each row, and the column right and left of each
+        # column
+        self.row_below = (self.lattice.next * rows).tolist()
+        self.row_above = (self.lattice.prev * rows).tolist()
+        self.col_right = self.lattice.next.tolist()
+        self.col_left = self.lattice.prev.tolist()
+
+    def run(self, steps):
+        """Attempts steps single spin flips."""
+        s = memoryview(self.spins.reshape(-1))
+        rows = self.rows
+        below, above, right, left = self.row_below, self.row_above, self.col_right, self.col_left
+        table = self.table.tolist()
+        obs = self.observables
+        e = m = 0  # Change in energy and magnetisation since the observables were last updated
+
+        remaining = steps
+        while remaining > 0:
+            block = min(remaining, self.block_size)
+            sites = self.rng.integers(0, len(s), block).tolist()
+            uniforms = self.rng.random(block).tolist()
+
+            start = 0
+            while start < block:
+                # Stop at the next sample so the running totals can be recorded
+                end = block if obs is None else min(block, start + obs.steps_to_next_sample(self.total_steps))
+                for k, u in zip(sites[start:end], uniforms[start:end]):
+                    row, col = divmod(k, rows)
+                    sk = s[k]
+                    sh = sk * (s[below[row] + col] + s[above[row] + col] + s[k - col + right[col]]
+                               + s[k - col + left[col]])
+                    if u < table[sh + 4]:
+                        s[k] = -sk
+                        e += sh
+                        m -= sk
+
+                self.total_steps += end - start
+                if obs is not None:
+                    obs.flip(2 * J * e, 2 * m)
+                    obs.advance(self.total_steps)
+                    e = m = 0
+                start = end
+
+            remaining -= block
+
+        return self.spins
+
+    def sweep(self, sweeps=1):
+        """One sweep is rows*rows attempted flips."""
+        return self.run(sweeps * self.spins.size)
+
+
+def save_checkpoint(engine, path, **extras):
+    """Writes the state of an engine, and any extra arrays, to a compressed .npz file.
+
+    The file holds the spins, temperature, step counter, the state of the random generator and the running
+    observables, so a run reloaded with load_checkpoint carries on exactly where it stopped. The checkpoint is
+    written to a temporary file first and then renamed, so a job killed mid write keeps its last checkpoint.
+    """
+    state = {
+        "spins": engine.spins,
+        "temp": engine.temp,
+        "total_steps": engine.total_steps,
+        "rng_state": json.dumps(engine.rng.bit_generator.state),
+    }
+    obs = engine.observables
+    if obs is not None:
+        state.update({
+            "obs_stride": obs.stride,
+            "obs_count": obs.count,
+            "obs_next_sample": obs.next_sample,
+            "obs_energy": obs.energy,
+            "obs_magnetisation": obs.magnetisation,
+            "obs_steps": obs.steps,
+            "obs_energies": obs.energies,
+            "obs_magnetisations": obs.magnetisations,
+        })
+    for name in extras:
+        state["extra_" + name] = extras[name]
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **state)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(engine, path):
+    """Restores a checkpoint written by save_checkpoint into engine and returns the extra arrays as a dict.
+
+    engine must be the same type and size as the one that was saved.
+    """
+    with np.load(path) as data:
+        if data["spins"].shape != engine.spins.shape:
+            raise ValueError("Checkpoint %s is for a %s lattice, not %s" % (path, data["spins"].shape, engine.spins.shape))
+
+        engine.spins[...] = data["spins"]
+        engine.temp = float(data["temp"])
+        engine.total_steps = int(data["total_steps"])
+        engine.rng.bit_generator.state = json.loads(str(data["rng_state"]))
+
+        if "obs_stride" in data:
+            obs = Observables(engine.spins, int(data["obs_stride"]), data["obs_steps"].size)
+            obs.count = int(data["obs_count"])
+            obs.next_sample = int(data["obs_next_sample"])
+            obs.energy = int(data["obs_energy"])
+            obs.magnetisation = int(data["obs_magnetisation"])
+            obs.steps[...] = data["obs_steps"]
+            obs.energies[...] = data["obs_energies"]
+            obs.magnetisations[...] = data["obs_magnetisations"]
+            engine.observables = obs
+        else:
+            engine.observables = None
+
+        return {name[len("extra_"):]: data[name] for name in data.files if name.startswith("extra_")}
+
+
+def main():
+    rows = 1000
+
+    # The random site engine is still a python loop, so it gets fewer sweeps
+    for engine, sweeps in [(CheckerboardEngine(rows, temp=1.5, seed=1), 20),
+                           (RandomSiteEngine(rows, temp=1.5, seed=1), 2)]:
+        start = time.perf_counter()
+        engine.sweep(sweeps)
+        elapsed = time.perf_counter() - start
+
+        print(type(engine).__name__)
+        print("Spin updates per second: %.3g" % (engine.total_steps / elapsed))
+        print("Magnetisation per spin: %.4f" % (engine.magnetisation() / engine.spins.size))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,117 +1,102 @@
 import pygame
-import random
-import math
+import numpy as np
+
+from IsingEngine import RandomSiteEngine
+from DoubleBuffer import DoubleBuffer, SimulationThread
 
 
 W = 600
-win = pygame.display.set_mode((W, W))
-pygame.display.set_caption("Ising model")
-pygame.init()
+FPS = 60
 
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
 
-class Spot:
-    def __init__(self, row, col, width, total_rows):
-        self.row = row
-        self.col = col
-        self.x = row * width
-        self.y = col * width
-        self.neighbours = []
-        self.width = width
-        self.total_rows = total_rows
-
-        p = random.random()
-        if p < 0.5:
-            self.colour = WHITE
-            self.s = 1
-        else:
-            self.colour = BLACK
-            self.s = -1
-
-    def draw(self, win):
-        pygame.draw.rect(win, self.colour, (self.x, self.y, self.width, self.width))
-
-    def update_neighbours(self, grid):
-        self.neighbours = []
-        if self.row < self.total_rows - 1:  # DOWN
-            self.neighbours.append(grid[self.row + 1][self.col])
-
-        if self.row > 0:  # UP
-            self.neighbours.append(grid[self.row - 1][self.col])
-
-        if self.col < self.total_rows - 1:  # Right
-            self.neighbours.append(grid[self.row][self.col + 1])
-
-        if self.row > 0:  # Left
-            self.neighbours.append(grid[self.row][self.col - 1])
-
-    def get_spot_energy(self):
-        neighbour_energy = 0
-        for n in self.neighbours:
-            neighbour_energy += n.s
-
-        self.spot_energy = -self.s * neighbour_energy
-
-
-def make_grid(rows, width):
-    grid = []
-    gap = width // rows
-    for i in range(rows):
-        grid.append([])
-        for j in range(rows):
-            spot = Spot(i, j, gap, rows)
-            grid[i].append(spot)
-    return grid
-
-
-def draw(win, grid):
-    win.fill(WHITE)
-    for row in grid:
-        for spot in row:
-            spot.draw(win)
-    pygame.display.update()
-
-
-def monte_carlo(grid, rows, steps):
-    temp = 1.5
-
-    for i in range(steps):
-        rand_spot_x = random.randrange(rows)
-        rand_spot_y = random.randrange(rows)
-        grid[rand_spot_y][rand_spot_x].update_neighbours(grid)
-        grid[rand_spot_y][rand_spot_x].get_spot_energy()
-
-        if grid[rand_spot_y][rand_spot_x].spot_energy > 0:
-            grid[rand_spot_y][rand_spot_x].s *= -1
-        elif grid[rand_spot_y][rand_spot_x].spot_energy < 0:
-            p = random.random()
-            if p < math.e**(2*grid[rand_spot_y][rand_spot_x].spot_energy/temp):
-                grid[rand_spot_y][rand_spot_x].s *= -1
-
-        if grid[rand_spot_y][rand_spot_x].s == 1:
-            grid[rand_spot_y][rand_spot_x].colour = WHITE
-        else:
-            grid[rand_spot_y][rand_spot_x].colour = BLACK
-
-    return grid
+class LatticeRenderer:
+    """Draws spins through a surface with one pixel per site, scaled up onto the window.
+
+    Only the tiles of tile x tile sites that changed since the last frame are scaled and blitted, and only
+    their rectangles are passed to pygame.display.update.
+    """
+
+    def __init__(self, win, rows, width, tile=10):
+        self.win = win
+        self.rows = rows
+        self.gap = width // rows
+        self.tile = tile
+        self.surface = pygame.Surface((rows, rows))
+        self.palette = np.array([BLACK, WHITE], dtype=np.uint8)
+        self.previous = None
+
+    def dirty_tiles(self, spins):
+        """(row, col) of the top left site of every tile that changed since the last frame."""
+        if self.previous is None:
+            return None
+        t = self.tile
+        n = -(-self.rows // t)  # Tiles along each side, rounded up
+        changed = np.zeros((n * t, n * t), dtype=bool)
+        changed[:self.rows, :self.rows] = spins != self.previous
+        rows, cols = np.nonzero(changed.reshape(n, t, n, t).any(axis=(1, 3)))
+        return list(zip(rows * t, cols * t))
+
+    def draw(self, spins):
+        # surfarray indexes pixels [x][y] and the rows of the lattice run along x, as in the Spot grid
+        pygame.surfarray.blit_array(self.surface, self.palette[(spins + 1) // 2])
+        tiles = self.dirty_tiles(spins)
+        self.previous = spins.copy()
+
+        size = self.rows * self.gap
+        if tiles is None or len(tiles) * self.tile**2 > self.rows**2 // 2:
+            # Most of the lattice changed so scale it in one go
+            self.win.blit(pygame.transform.scale(self.surface, (size, size)), (0, 0))
+            pygame.display.update()
+            return
+
+        rects = []
+        for row, col in tiles:
+            src = pygame.Rect(row, col, self.tile, self.tile).clip(self.surface.get_rect())
+            dest = pygame.Rect(src.x * self.gap, src.y * self.gap, src.w * self.gap, src.h * self.gap)
+            self.win.blit(pygame.transform.scale(self.surface.subsurface(src), dest.size), dest)
+            rects.append(dest)
+        pygame.display.update(rects)
 
 
 def main(win, width):
     ROWS = 100
-    grid = make_grid(ROWS, width)
-    total_steps = 0
+    temp = 1.5
+    engine = RandomSiteEngine(ROWS, temp)
+    renderer = LatticeRenderer(win, ROWS, width)
     steps = 10000
 
+    def write(back):
+        back[...] = engine.spins
+
+    # The Monte Carlo runs on its own thread and the window draws the latest copy of the spins
+    buffer = DoubleBuffer(engine.spins.copy(), engine.spins.copy())
+    worker = SimulationThread(lambda: engine.run(steps), write, buffer)
+    worker.start()
+
+    clock = pygame.time.Clock()
+    last_steps = 0
     while True:
-        draw(win, grid)
-        grid = monte_carlo(grid, ROWS, steps)
-        total_steps += steps
-        print(total_steps)
+        with buffer.front() as spins:
+            renderer.draw(spins)
+        if engine.total_steps != last_steps:
+            last_steps = engine.total_steps
+            print(last_steps)
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                worker.stop()
                 pygame.quit()
+                return
+        clock.tick(FPS)
 
 
-main(win, W)
+if __name__ == '__main__':
+    # Only open the window when run as a script, so the module can be imported on headless machines.
+    # Batch runs go through IsingBatch.py.
+    win = pygame.display.set_mode((W, W))
+    pygame.display.set_caption("Ising model")
+    pygame.init()
+    main(win, W)
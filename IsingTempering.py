@@ -0,0 +1,151 @@
+# Parallel tempering (replica exchange) for the Ising model.
+# One replica per temperature runs in its own process. After every few sweeps the driver proposes swapping the
+# configurations of each pair of neighbouring temperatures, accepted with probability
+#   min(1, exp((1/T_i - 1/T_j) * (E_i - E_j)))
+# so configurations from the hot, quickly decorrelating end of the ladder diffuse down to the cold end.
+#
+# Swapping two configurations is the same as swapping the temperatures of the two replicas, which only sends a
+# float to each process instead of a whole lattice, so that is what the driver does.
+#
+# Example:
+#   python IsingTempering.py --rows 64 --temps 2.0 2.1 2.2 2.27 2.35 2.45 2.6 --exchanges 2000
+
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+
+from IsingEngine import CheckerboardEngine
+
+
+def replica(conn, rows, temp, seed):
+    # Worker process: holds one engine and answers commands from the driver until told to stop
+    engine = CheckerboardEngine(rows, temp, seed=seed)
+    while True:
+        command, value = conn.recv()
+        if command == "sweep":
+            engine.sweep(value)
+            conn.send((engine.energy(), engine.magnetisation()))
+        elif command == "temp":
+            engine.temp = value
+        elif command == "spins":
+            conn.send(engine.spins)
+        elif command == "stop":
+            conn.close()
+            return
+
+
+class ParallelTempering:
+    """Runs one CheckerboardEngine per temperature in worker processes and exchanges neighbouring replicas."""
+
+    def __init__(self, rows, temps, seed=None, sweeps_per_exchange=10):
+        self.temps = np.sort(np.asarray(temps, dtype=float))
+        self.sweeps_per_exchange = sweeps_per_exchange
+        self.rng = np.random.default_rng(seed)
+        seeds = np.random.SeedSequence(seed).spawn(len(self.temps))
+
+        # replica_at[k] is the replica currently at temperature k
+        self.replica_at = np.arange(len(self.temps))
+        self.attempted = np.zeros(len(self.temps) - 1, dtype=np.int64)
+        self.accepted = np.zeros(len(self.temps) - 1, dtype=np.int64)
+        self.exchanges = 0
+
+        self.conns = []
+        self.processes = []
+        for temp, replica_seed in zip(self.temps, seeds):
+            parent, child = mp.Pipe()
+            process = mp.Process(target=replica, args=(child, rows, temp, replica_seed), daemon=True)
+            process.start()
+            self.conns.append(parent)
+            self.processes.append(process)
+
+    def step(self):
+        """Sweeps every replica and then attempts the exchanges.
+
+        Returns the energy and magnetisation at each temperature (before the exchange), ordered by temperature.
+        """
+        for conn in self.conns:
+            conn.send(("sweep", self.sweeps_per_exchange))
+        results = np.array([conn.recv() for conn in self.conns], dtype=float)
+        energies = results[self.replica_at, 0]
+        magnetisations = results[self.replica_at, 1]
+
+        # Alternate between the even and odd pairs so that every pair gets an attempt every two steps
+        e = energies.copy()
+        for k in range(self.exchanges % 2, len(self.temps) - 1, 2):
+            self.attempted[k] += 1
+            delta = (1 / self.temps[k] - 1 / self.temps[k + 1]) * (e[k] - e[k + 1])
+            if delta >= 0 or self.rng.random() < np.exp(delta):
+                self.accepted[k] += 1
+                self.replica_at[k], self.replica_at[k + 1] = self.replica_at[k + 1], self.replica_at[k]
+                e[k], e[k + 1] = e[k + 1], e[k]
+                self.conns[self.replica_at[k]].send(("temp", self.temps[k]))
+                self.conns[self.replica_at[k + 1]].send(("temp", self.temps[k + 1]))
+        self.exchanges += 1
+
+        return energies, magnetisations
+
+    def run(self, exchanges):
+        """Returns arrays of shape (exchanges, len(temps)) of the energy and magnetisation at each temperature."""
+        energies = np.empty((exchanges, len(self.temps)))
+        magnetisations = np.empty((exchanges, len(self.temps)))
+        for i in range(exchanges):
+            energies[i], magnetisations[i] = self.step()
+        return energies, magnetisations
+
+    def acceptance_rates(self):
+        """Fraction of accepted exchanges between temps[k] and temps[k + 1]."""
+        return self.accepted / np.maximum(self.attempted, 1)
+
+    def spins(self):
+        """The configuration at each temperature, ordered by temperature."""
+        for k in self.replica_at:
+            self.conns[k].send(("spins", None))
+        return [self.conns[k].recv() for k in self.replica_at]
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(("stop", None))
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel tempering of the Ising model, one process per temperature.")
+    parser.add_argument("--temps", type=float, nargs="+", required=True)
+    parser.add_argument("--rows", type=int, default=32, help="Number of rows (must be even)")
+    parser.add_argument("--exchanges", type=int, default=1000)
+    parser.add_argument("--burn-in", type=int, default=100, help="Exchanges discarded before measuring")
+    parser.add_argument("--sweeps-per-exchange", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    n = args.rows * args.rows
+
+    with ParallelTempering(args.rows, args.temps, args.seed, args.sweeps_per_exchange) as pt:
+        pt.run(args.burn_in)
+        energies, magnetisations = pt.run(args.exchanges)
+        rates = pt.acceptance_rates()
+        temps = pt.temps
+
+    print("%8s %10s %10s" % ("temp", "energy", "|m|"))
+    for k, temp in enumerate(temps):
+        print("%8.3f %10.4f %10.4f" % (temp, energies[:, k].mean() / n, np.abs(magnetisations[:, k]).mean() / n))
+
+    print()
+    print("Exchange acceptance rates")
+    for k, rate in enumerate(rates):
+        print("%8.3f <-> %-8.3f %6.3f" % (temps[k], temps[k + 1], rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Answers many start/end queries against one obstacle map.
+# The grid is built once per process (once in the parent for solve, once per worker for solve_batch) and
+# every query reuses it, instead of rebuilding the neighbours of every Spot before each search.
+#
+# Example:
+#   python PathBatch.py --grid map.npy --queries 1000 --workers 4 -o paths.csv
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from PathEngine import Grid, SEARCHES
+
+_worker_grid = None  # The Grid and search function of a worker process, set once by _init_worker
+_worker_search = None
+
+
+def _init_worker(occupancy, mode):
+    global _worker_grid, _worker_search
+    _worker_grid = Grid(occupancy)
+    _worker_search = SEARCHES[mode]
+
+
+def _solve(query):
+    start, end = query
+    return _worker_search(_worker_grid, start, end)
+
+
+def load_occupancy(path):
+    """Loads a barrier map saved with np.save, non zero cells are barriers."""
+    return np.load(path).astype(bool)
+
+
+class PathSolver:
+    """Loads an occupancy grid once and answers single queries or batches of (start, end) queries.
+
+    mode is the name of the search in PathEngine.SEARCHES.
+    """
+
+    def __init__(self, occupancy, mode="astar"):
+        self.occupancy = np.asarray(occupancy, dtype=bool)
+        self.grid = Grid(self.occupancy)
+        self.mode = mode
+        self.search = SEARCHES[mode]
+
+    def solve(self, start, end):
+        return self.search(self.grid, start, end)
+
+    def solve_batch(self, queries, workers=None, chunksize=16):
+        """Returns a SearchResult for every (start, end) pair, in the order of queries.
+
+        With workers=1 the queries are answered in this process, otherwise they are spread over a process pool
+        in which every worker builds the grid once.
+        """
+        queries = [(tuple(start), tuple(end)) for start, end in queries]
+        if workers == 1:
+            return [self.solve(start, end) for start, end in queries]
+
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.occupancy, self.mode)) as pool:
+            return list(pool.map(_solve, queries, chunksize=chunksize))
+
+
+def random_queries(occupancy, count, rng):
+    """count (start, end) pairs of random free cells."""
+    free = np.argwhere(~np.asarray(occupancy, dtype=bool))
+    pairs = free[rng.integers(0, len(free), (count, 2))]
+    return [(tuple(int(v) for v in start), tuple(int(v) for v in end)) for start, end in pairs]
+
+
+def write_results(queries, results, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_row", "start_col", "end_row", "end_col", "cost", "expansions", "pushes", "max_open"])
+        for (start, end), result in zip(queries, results):
+            writer.writerow([*start, *end, result.cost, result.expansions, result.pushes, result.max_open])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a batch of random path queries on one grid.")
+    parser.add_argument("--grid", help="Barrier map saved with np.save, otherwise a random map is used")
+    parser.add_argument("--size", type=int, default=500, help="Rows and columns of the random map")
+    parser.add_argument("--density", type=float, default=0.2, help="Fraction of barriers in the random map")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--mode", choices=sorted(SEARCHES), default="astar")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="CSV file for the cost and expansions of every query")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    if args.grid is not None:
+        occupancy = load_occupancy(args.grid)
+    else:
+        occupancy = rng.random((args.size, args.size)) < args.density
+
+    solver = PathSolver(occupancy, args.mode)
+    queries = random_queries(occupancy, args.queries, rng)
+
+    start = time.perf_counter()
+    results = solver.solve_batch(queries, args.workers)
+    elapsed = time.perf_counter() - start
+
+    solved = sum(result.path is not None for result in results)
+    expansions = sum(result.expansions for result in results)
+    print("%d queries (%d with a path) in %.2f s: %.1f queries/s, %.3g expansions/s"
+          % (len(queries), solved, elapsed, len(queries) / elapsed, expansions / elapsed))
+
+    if args.output is not None:
+        write_results(queries, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
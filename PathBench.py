@@ -0,0 +1,226 @@
+# Benchmarks of the path finding searches on seeded maps, for spotting regressions between versions.
+# Every map kind is generated at each size from the seed, and every search that can run on it answers the same
+# queries. Each row of the results has the wall time, the expansions, pushes and largest open set from the
+# SearchResult, and the peak memory traced by tracemalloc in a second, separate run of the same query.
+#
+# Example:
+#   python PathBench.py --sizes 64 128 256 --queries 5 -o bench.csv
+#   python PathBench.py --maps maze --modes astar jps hpa -o bench.json
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from PathEngine import INF, Grid, astar, bidirectional_astar, jps
+from PathField import distance_field
+from PathHierarchy import PathHierarchy
+from PathReplan import DStarLite
+from PathWeighted import CostGrid, dial, random_terrain, weighted_astar
+
+
+FIELDS = ["version", "map", "size", "seed", "mode", "query", "start", "end", "setup_s", "search_s", "cost",
+          "path_length", "expansions", "pushes", "max_open", "peak_bytes"]
+
+
+def open_field(size, rng):
+    """No barriers at all."""
+    return np.zeros((size, size), dtype=bool)
+
+
+def random_maze(size, rng):
+    """A perfect maze carved by a randomised depth first search, True cells are walls.
+
+    Passages are on the even rows and columns, so every even cell can reach every other one.
+    """
+    walls = np.ones((size, size), dtype=bool)
+    walls[0, 0] = False
+    stack = [(0, 0)]
+    while stack:
+        row, col = stack[-1]
+        options = [(row + dr, col + dc) for dr, dc in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                   if 0 <= row + dr < size and 0 <= col + dc < size and walls[row + dr, col + dc]]
+        if not options:
+            stack.pop()
+            continue
+        next_row, next_col = options[rng.integers(len(options))]
+        walls[(row + next_row) // 2, (col + next_col) // 2] = False
+        walls[next_row, next_col] = False
+        stack.append((next_row, next_col))
+    return walls
+
+
+def terrain(size, rng):
+    """Costs z + 1 with z from 0 to 9, see PathWeighted.random_terrain."""
+    return random_terrain(size, 9, rng)
+
+
+# name -> (generator, whether the map is a cost map rather than barrier flags)
+MAPS = {
+    "open": (open_field, False),
+    "maze": (random_maze, False),
+    "terrain": (terrain, True),
+}
+
+
+def costs_of(barriers):
+    return np.where(barriers, INF, 1.0)
+
+
+def _jps_grid(barriers):
+    # The jump table is part of the setup, it is built once per grid rather than per query
+    grid = Grid(barriers)
+    grid.jump_table()
+    return grid
+
+
+def _dstar(costs, start, end):
+    return DStarLite(costs, start, end).plan()
+
+
+def _field(grid, start, end):
+    # Builds the field every time, the cost of the first query to a target
+    field = distance_field(grid, end)
+    result = field.path(start)
+    result.expansions = field.expansions
+    return result
+
+
+# name -> (whether it handles cost maps, prepare(map) run once per map, search(prepared, start, end))
+MODES = {
+    "astar": (False, Grid, astar),
+    "jps": (False, _jps_grid, jps),
+    "bidirectional": (False, Grid, bidirectional_astar),
+    "hpa": (False, lambda barriers: PathHierarchy(barriers, 16), lambda hierarchy, s, e: hierarchy.find_path(s, e)),
+    "dial": (True, CostGrid, dial),
+    "heap": (True, CostGrid, weighted_astar),
+    "dstar": (True, lambda costs: costs, _dstar),
+    "field": (True, CostGrid, _field),
+}
+
+
+def free_cells(cells, weighted):
+    free = np.isfinite(cells) if weighted else ~cells
+    return np.argwhere(free)
+
+
+def make_queries(cells, weighted, count, rng):
+    """The corner to corner query (or the nearest free cells to the corners) followed by random free pairs."""
+    free = free_cells(cells, weighted)
+    queries = [(tuple(int(v) for v in free[0]), tuple(int(v) for v in free[-1]))]
+    for start, end in free[rng.integers(0, len(free), (max(count - 1, 0), 2))]:
+        queries.append((tuple(int(v) for v in start), tuple(int(v) for v in end)))
+    return queries[:count]
+
+
+def measure(search, prepared, start, end, trace_memory):
+    begin = time.perf_counter()
+    result = search(prepared, start, end)
+    seconds = time.perf_counter() - begin
+
+    peak = None
+    if trace_memory:
+        # Traced separately, tracemalloc slows every allocation down
+        tracemalloc.start()
+        search(prepared, start, end)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def version_label():
+    """Short hash of the checked out commit, or unknown outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(maps, sizes, modes, queries, seed, trace_memory=True, label=None):
+    """One dict per (map, size, mode, query), in that order."""
+    label = label if label is not None else version_label()
+    rows = []
+    for map_name in maps:
+        generate, weighted = MAPS[map_name]
+        for size in sizes:
+            rng = np.random.default_rng([seed, size])
+            cells = generate(size, rng)
+            map_queries = make_queries(cells, weighted, queries, rng)
+
+            for mode in modes:
+                handles_costs, prepare, search = MODES[mode]
+                if weighted and not handles_costs:
+                    continue
+                begin = time.perf_counter()
+                prepared = prepare(cells if weighted or not handles_costs else costs_of(cells))
+                setup = time.perf_counter() - begin
+
+                for index, (start, end) in enumerate(map_queries):
+                    result, seconds, peak = measure(search, prepared, start, end, trace_memory)
+                    rows.append({
+                        "version": label, "map": map_name, "size": size, "seed": seed, "mode": mode,
+                        "query": index, "start": "%d,%d" % start, "end": "%d,%d" % end,
+                        "setup_s": round(setup, 6), "search_s": round(seconds, 6), "cost": result.cost,
+                        "path_length": len(result.path) if result.path is not None else 0,
+                        "expansions": result.expansions, "pushes": result.pushes, "max_open": result.max_open,
+                        "peak_bytes": peak,
+                    })
+    return rows
+
+
+def write_results(rows, path):
+    """CSV, or JSON if path ends in .json."""
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=1, default=str)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the path finding searches on seeded maps.")
+    parser.add_argument("--maps", nargs="+", choices=sorted(MAPS), default=sorted(MAPS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=list(MODES))
+    parser.add_argument("--queries", type=int, default=3, help="Queries per map, the first is corner to corner")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of every query")
+    parser.add_argument("--label", help="Version recorded with the results, the git commit by default")
+    parser.add_argument("-o", "--output", help="CSV or .json file for every query")
+    args = parser.parse_args(argv)
+    if args.queries < 1:
+        parser.error("--queries must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = run_benchmarks(args.maps, args.sizes, args.modes, args.queries, args.seed, not args.no_memory,
+                          args.label)
+    if not rows:
+        # Still writes the (empty) output, so scripts reading it find a file
+        print("None of the modes %s run on the maps %s" % (", ".join(args.modes), ", ".join(args.maps)))
+    else:
+        print("%-8s %6s %-13s %10s %12s %10s %12s" % ("map", "size", "mode", "search s", "expansions", "max open",
+                                                       "peak KiB"))
+    for row in rows:
+        if row["query"] == 0:
+            peak = "%.0f" % (row["peak_bytes"] / 1024) if row["peak_bytes"] is not None else "-"
+            print("%-8s %6d %-13s %10.4f %12d %10d %12s" % (row["map"], row["size"], row["mode"], row["search_s"],
+                                                            row["expansions"], row["max_open"], peak))
+
+    if args.output is not None:
+        write_results(rows, args.output)
+
+
+if __name__ == '__main__':
+    main()
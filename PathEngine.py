@@ -0,0 +1,433 @@
+# Headless path finding on 4-connected grids.
+# The grid is a flat list of barrier flags with a border of barriers all the way round, so every node is an
+# integer ID and its neighbours are ID +- 1 and ID +- width with no bounds checks. Scores are kept in flat
+# lists allocated once per search and the open set is a heapq of (f, h, node) tuples. Drawing is left to
+# optional hooks, so the same search works with or without a pygame window.
+
+import heapq
+import threading
+import numpy as np
+
+INF = float("inf")
+
+
+class Grid:
+    """A rows x cols occupancy grid, where True (or non zero) cells are barriers."""
+
+    def __init__(self, occupancy):
+        occupancy = np.asarray(occupancy, dtype=bool)
+        self.rows, self.cols = occupancy.shape
+        self.width = self.cols + 2
+
+        padded = np.ones((self.rows + 2, self.cols + 2), dtype=bool)
+        padded[1:-1, 1:-1] = occupancy
+        self.blocked = padded.ravel().tolist()
+        self.size = len(self.blocked)
+        self.offsets = (self.width, -self.width, 1, -1)  # DOWN, UP, RIGHT, LEFT
+        self._jumps = None  # Tables for jps, see jump_table
+
+    def node(self, pos):
+        row, col = pos
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise ValueError("%s is outside the %d x %d grid" % (pos, self.rows, self.cols))
+        return (row + 1) * self.width + col + 1
+
+    def pos(self, node):
+        row, col = divmod(node, self.width)
+        return row - 1, col - 1
+
+    def is_barrier(self, pos):
+        return self.blocked[self.node(pos)]
+
+    def set_barrier(self, pos, barrier=True):
+        self.blocked[self.node(pos)] = bool(barrier)
+        self._jumps = None
+
+    def jump_table(self):
+        """Precomputed jumps for jps, built on first use and dropped whenever a barrier changes.
+
+        (right, left, down, up, barriers_before): the first four give, for every node, the next node in that
+        direction that is a barrier or a jump point, and barriers_before counts the barriers to the left of
+        each node in its row, so two nodes in a row can see each other if the counts are the same.
+        """
+        if self._jumps is None:
+            self._jumps = _jump_table(np.reshape(self.blocked, (self.rows + 2, self.width)))
+        return self._jumps
+
+
+def _next_event(events, axis, forward):
+    """Flat node index of the first event strictly after (or before) each cell along axis.
+
+    The cells at both ends of every line are border barriers, which no jump starts from, so what they get
+    doesn't matter.
+    """
+    lines = np.moveaxis(events, axis, 1)
+    n = lines.shape[1]
+    index = np.arange(n)
+    if forward:
+        position = np.minimum.accumulate(np.where(lines, index, n - 1)[:, ::-1], axis=1)[:, ::-1]
+        position = np.roll(position, -1, axis=1)
+    else:
+        position = np.roll(np.maximum.accumulate(np.where(lines, index, 0), axis=1), 1, axis=1)
+
+    rows, width = events.shape
+    if axis == 1:
+        return np.arange(rows)[:, None] * width + position
+    return np.moveaxis(position, 1, 0) * width + np.arange(width)
+
+
+def _jump_table(blocked):
+    # blocked is the padded (rows + 2, cols + 2) array of barrier flags
+    padded = np.pad(blocked, 1, constant_values=True)
+
+    def at(dr, dc):
+        # blocked[r + dr, c + dc] for every cell
+        return padded[1 + dr:padded.shape[0] - 1 + dr, 1 + dc:padded.shape[1] - 1 + dc]
+
+    # A side cell that opens up after being blocked one step back, for each direction of travel
+    forced_right = (~at(-1, 0) & at(-1, -1)) | (~at(1, 0) & at(1, -1))
+    forced_left = (~at(-1, 0) & at(-1, 1)) | (~at(1, 0) & at(1, 1))
+    forced_down = (~at(0, -1) & at(-1, -1)) | (~at(0, 1) & at(-1, 1))
+    forced_up = (~at(0, -1) & at(1, -1)) | (~at(0, 1) & at(1, 1))
+
+    flat = blocked.ravel()
+    right = _next_event(blocked | forced_right, 1, True)
+    left = _next_event(blocked | forced_left, 1, False)
+    # Moving along a column, a cell with a jump point along its row is a jump point too
+    row_jump = ~flat[right] | ~flat[left]
+    down = _next_event(blocked | forced_down | row_jump, 0, True)
+    up = _next_event(blocked | forced_up | row_jump, 0, False)
+    barriers_before = np.cumsum(blocked, axis=1)
+    return tuple(table.ravel().tolist() for table in (right, left, down, up, barriers_before))
+
+
+def occupancy_from_spots(grid):
+    """Barrier flags of a PathFinder grid of Spot objects, occupancy[row][col] = spot.is_barrier()."""
+    return np.array([[spot.is_barrier() for spot in row] for row in grid], dtype=bool)
+
+
+class SearchResult:
+    """The outcome of a search. path is a list of (row, col) from start to end, or None if there is no path."""
+
+    def __init__(self, path, cost, expansions, pushes, max_open):
+        self.path = path
+        self.cost = cost
+        self.expansions = expansions  # Nodes taken off the open set and expanded
+        self.pushes = pushes  # Nodes pushed onto the open set
+        self.max_open = max_open  # Largest size of the open set
+
+    def __repr__(self):
+        return "SearchResult(cost=%s, expansions=%d, pushes=%d, max_open=%d)" % (
+            self.cost, self.expansions, self.pushes, self.max_open)
+
+
+def reconstruct_path(grid, came_from, end):
+    path = [end]
+    while came_from[path[-1]] != -1:
+        path.append(came_from[path[-1]])
+    path.reverse()
+    return [grid.pos(node) for node in path]
+
+
+def astar(grid, start, end, on_open=None, on_close=None):
+    """A* with the Manhattan heuristic and unit step costs.
+
+    on_open(pos) is called when a cell is first added to the open set and on_close(pos) when it is expanded.
+    Ties in f are broken toward the smaller h, i.e. the node closer to the end.
+    """
+    s = grid.node(start)
+    t = grid.node(end)
+    if grid.blocked[s] or grid.blocked[t]:
+        return SearchResult(None, INF, 0, 0, 0)
+
+    width = grid.width
+    blocked = grid.blocked
+    offsets = grid.offsets
+    end_row, end_col = divmod(t, width)
+    row, col = divmod(s, width)
+
+    g = [INF] * grid.size
+    came_from = [-1] * grid.size
+    closed = bytearray(grid.size)
+
+    h = abs(row - end_row) + abs(col - end_col)
+    g[s] = 0
+    open_set = [(h, h, s)]
+    pushes = 1
+    max_open = 1
+    expansions = 0
+
+    while open_set:
+        _, _, current = heapq.heappop(open_set)
+        if closed[current]:
+            # Stale entry, the node was pushed again with a better score and has already been expanded
+            continue
+        closed[current] = 1
+        expansions += 1
+        if on_close is not None:
+            on_close(grid.pos(current))
+
+        if current == t:
+            return SearchResult(reconstruct_path(grid, came_from, t), g[t], expansions, pushes, max_open)
+
+        temp_g_score = g[current] + 1
+        for d in offsets:
+            neighbour = current + d
+            if blocked[neighbour] or closed[neighbour] or temp_g_score >= g[neighbour]:
+                continue
+
+            if on_open is not None and g[neighbour] == INF:
+                on_open(grid.pos(neighbour))
+            g[neighbour] = temp_g_score
+            came_from[neighbour] = current
+            row, col = divmod(neighbour, width)
+            h = abs(row - end_row) + abs(col - end_col)
+            heapq.heappush(open_set, (temp_g_score + h, h, neighbour))
+            pushes += 1
+
+        if len(open_set) > max_open:
+            max_open = len(open_set)
+
+    return SearchResult(None, INF, expansions, pushes, max_open)
+
+
+def interpolate_path(grid, jump_points):
+    """Fills in the cells between consecutive jump points, which are always in a straight line."""
+    path = [jump_points[0]]
+    for a, b in zip(jump_points, jump_points[1:]):
+        step = (1 if b > a else -1) if abs(b - a) < grid.width else (grid.width if b > a else -grid.width)
+        path.extend(range(a + step, b + step, step))
+    return [grid.pos(node) for node in path]
+
+
+def jps(grid, start, end, on_open=None, on_close=None):
+    """Jump Point Search for 4-connected grids with unit step costs.
+
+    Rather than pushing every neighbour, the search jumps in a straight line until it reaches the end, a
+    barrier, or a jump point: a cell where a turn might be needed, because a side cell opens up that was
+    blocked one step back. While moving along a column every cell also looks for jump points along its row.
+    Only jump points go on the open set, and successors skip the direction the search came from. The path
+    lengths are the same as astar.
+
+    Where each jump stops is looked up in Grid.jump_table (JPS+), so a jump is O(1) apart from checking
+    whether the end is on the way. The table is built the first time a grid is searched.
+    """
+    s = grid.node(start)
+    t = grid.node(end)
+    if grid.blocked[s] or grid.blocked[t]:
+        return SearchResult(None, INF, 0, 0, 0)
+
+    width = grid.width
+    blocked = grid.blocked
+    end_row, end_col = divmod(t, width)
+    right, left, down, up, barriers_before = grid.jump_table()
+    end_barriers = barriers_before[t]
+
+    def jump_along_row(node, d):
+        # d is +1 or -1, moving along the row. Stops at the end if it comes before the next event.
+        event = right[node] if d == 1 else left[node]
+        if node // width == end_row and 0 < (t - node) * d < (event - node) * d:
+            return t
+        return -1 if blocked[event] else event
+
+    def jump_along_col(node, d):
+        # d is +width or -width, moving along the column. The cell in the row of the end is also a jump point
+        # if it can see the end along its row.
+        event = down[node] if d == width else up[node]
+        cell = end_row * width + node % width
+        if 0 < (cell - node) * d < (event - node) * d and barriers_before[cell] == end_barriers:
+            return cell
+        return -1 if blocked[event] else event
+
+    g = {s: 0}
+    came_from = {}
+    closed = set()
+    row, col = divmod(s, width)
+    h = abs(row - end_row) + abs(col - end_col)
+    open_set = [(h, h, s)]
+    pushes = 1
+    max_open = 1
+    expansions = 0
+
+    while open_set:
+        _, _, current = heapq.heappop(open_set)
+        if current in closed:
+            continue
+        closed.add(current)
+        expansions += 1
+        if on_close is not None:
+            on_close(grid.pos(current))
+
+        if current == t:
+            jump_points = [t]
+            while jump_points[-1] in came_from:
+                jump_points.append(came_from[jump_points[-1]])
+            jump_points.reverse()
+            return SearchResult(interpolate_path(grid, jump_points), g[t], expansions, pushes, max_open)
+
+        if current in came_from:
+            diff = current - came_from[current]
+            if abs(diff) < width:
+                d = 1 if diff > 0 else -1
+                directions = (d, width, -width)
+            else:
+                d = width if diff > 0 else -width
+                directions = (d, 1, -1)
+        else:
+            directions = (width, -width, 1, -1)
+
+        for d in directions:
+            if d == 1 or d == -1:
+                jump_point = jump_along_row(current, d)
+                if jump_point == -1:
+                    continue
+                distance = abs(jump_point - current)
+            else:
+                jump_point = jump_along_col(current, d)
+                if jump_point == -1:
+                    continue
+                distance = abs(jump_point - current) // width
+
+            if jump_point in closed:
+                continue
+            temp_g_score = g[current] + distance
+            if temp_g_score >= g.get(jump_point, INF):
+                continue
+
+            if on_open is not None and jump_point not in g:
+                on_open(grid.pos(jump_point))
+            g[jump_point] = temp_g_score
+            came_from[jump_point] = current
+            row, col = divmod(jump_point, width)
+            h = abs(row - end_row) + abs(col - end_col)
+            heapq.heappush(open_set, (temp_g_score + h, h, jump_point))
+            pushes += 1
+
+        if len(open_set) > max_open:
+            max_open = len(open_set)
+
+    return SearchResult(None, INF, expansions, pushes, max_open)
+
+
+class _Frontier:
+    """One side of bidirectional_astar, searching from source with the Manhattan distance to target as h."""
+
+    def __init__(self, grid, source, target):
+        self.grid = grid
+        self.target_row, self.target_col = divmod(target, grid.width)
+        self.g = [INF] * grid.size
+        self.came_from = [-1] * grid.size
+        self.closed = bytearray(grid.size)
+        self.g[source] = 0
+        h = self.h(source)
+        self.open_set = [(h, h, source)]
+        self.pushes = 1
+        self.expansions = 0
+
+    def h(self, node):
+        row, col = divmod(node, self.grid.width)
+        return abs(row - self.target_row) + abs(col - self.target_col)
+
+    def top(self):
+        """Lowest f on the open set, dropping stale entries, or INF once it is empty."""
+        open_set = self.open_set
+        while open_set and self.closed[open_set[0][2]]:
+            heapq.heappop(open_set)
+        return open_set[0][0] if open_set else INF
+
+    def expand(self, other, best, on_open, on_close):
+        """Expands the best open node. best is [mu, meeting node], the shortest path found through both sides."""
+        _, _, current = heapq.heappop(self.open_set)
+        self.closed[current] = 1
+        self.expansions += 1
+        if on_close is not None:
+            on_close(self.grid.pos(current))
+
+        g = self.g
+        blocked = self.grid.blocked
+        temp_g_score = g[current] + 1
+        for d in self.grid.offsets:
+            neighbour = current + d
+            if blocked[neighbour] or self.closed[neighbour] or temp_g_score >= g[neighbour]:
+                continue
+
+            if on_open is not None and g[neighbour] == INF:
+                on_open(self.grid.pos(neighbour))
+            g[neighbour] = temp_g_score
+            self.came_from[neighbour] = current
+            h = self.h(neighbour)
+            heapq.heappush(self.open_set, (temp_g_score + h, h, neighbour))
+            self.pushes += 1
+
+            # A path through current and neighbour, if the other side has reached neighbour
+            if temp_g_score + other.g[neighbour] < best[0]:
+                best[0] = temp_g_score + other.g[neighbour]
+                best[1] = neighbour
+
+
+def bidirectional_astar(grid, start, end, on_open=None, on_close=None, threads=False):
+    """A* from both ends at once, each side with the Manhattan distance to the other end as its heuristic.
+
+    mu is the shortest start to end path found so far through a node reached by both sides. Every path still
+    to be found is at least as long as the lowest f on either open set, so the search stops once mu is no more
+    than the larger of the two. Each step expands the side with the smaller open set.
+
+    With threads=True the two sides run in their own threads and take turns with the shared frontiers under
+    a lock. The paths are the same, this only gains on a Python without the GIL.
+    """
+    s = grid.node(start)
+    t = grid.node(end)
+    if grid.blocked[s] or grid.blocked[t]:
+        return SearchResult(None, INF, 0, 0, 0)
+
+    forward = _Frontier(grid, s, t)
+    backward = _Frontier(grid, t, s)
+    best = [0 if s == t else INF, s]
+    max_open = 2
+
+    def finished():
+        return best[0] <= max(forward.top(), backward.top())
+
+    if threads:
+        lock = threading.Lock()
+        peak = [max_open]  # Largest size of the two open sets together, updated under the lock
+
+        def run(side, other):
+            while True:
+                with lock:
+                    if finished():
+                        return
+                    side.expand(other, best, on_open, on_close)
+                    peak[0] = max(peak[0], len(forward.open_set) + len(backward.open_set))
+
+        workers = [threading.Thread(target=run, args=(forward, backward)),
+                   threading.Thread(target=run, args=(backward, forward))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        max_open = peak[0]
+    else:
+        while not finished():
+            if not backward.open_set or (forward.open_set and len(forward.open_set) <= len(backward.open_set)):
+                forward.expand(backward, best, on_open, on_close)
+            else:
+                backward.expand(forward, best, on_open, on_close)
+            max_open = max(max_open, len(forward.open_set) + len(backward.open_set))
+
+    expansions = forward.expansions + backward.expansions
+    pushes = forward.pushes + backward.pushes
+    if best[0] == INF:
+        return SearchResult(None, INF, expansions, pushes, max_open)
+
+    meet = best[1]
+    path = [meet]
+    while forward.came_from[path[-1]] != -1:
+        path.append(forward.came_from[path[-1]])
+    path.reverse()
+    while backward.came_from[path[-1]] != -1:
+        path.append(backward.came_from[path[-1]])
+    return SearchResult([grid.pos(node) for node in path], best[0], expansions, pushes, max_open)
+
+
+SEARCHES = {"astar": astar, "jps": jps, "bidirectional": bidirectional_astar}
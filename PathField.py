@@ -0,0 +1,239 @@
+# Distance fields for queries that share a destination.
+# One Dijkstra run backwards from a target over a PathWeighted.CostGrid gives the cost of the cheapest path from
+# every cell to the target and the next cell along it. After that any path to the target is a walk down the
+# field with no search at all. Fields are kept in an LRU cache with a memory cap, can be saved as .npy, and are
+# dropped whenever a cell cost changes.
+#
+# Example:
+#   python PathField.py --size 1000 --queries 1000
+
+import argparse
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from PathEngine import INF, SearchResult
+from PathWeighted import CostGrid, random_terrain
+
+
+class DistanceField:
+    """Cheapest path costs from every cell to target, and the next cell along each path.
+
+    distance[row, col] is -1 where the target can't be reached. next_cell[row, col] is the row * cols + col of
+    the next cell, -1 at the target and where it can't be reached.
+    """
+
+    def __init__(self, target, distance, next_cell, expansions=0):
+        self.target = tuple(target)
+        self.distance = distance
+        self.next_cell = next_cell
+        self.expansions = expansions  # Nodes expanded building the field, 0 if it was loaded
+
+    @property
+    def nbytes(self):
+        return self.distance.nbytes + self.next_cell.nbytes
+
+    def cost(self, start):
+        row, col = start
+        rows, cols = self.distance.shape
+        if not (0 <= row < rows and 0 <= col < cols):
+            raise ValueError("%s is outside the %d x %d grid" % (tuple(start), rows, cols))
+        d = self.distance[row, col]
+        return INF if d < 0 else int(d)
+
+    def path(self, start):
+        """Walks the field from start to the target."""
+        start = tuple(start)
+        cost = self.cost(start)
+        if cost == INF:
+            return SearchResult(None, INF, 0, 0, 0)
+
+        cols = self.distance.shape[1]
+        next_of = self.next_cell.ravel().item  # item gives Python ints, faster than indexing one cell at a time
+        path = [start]
+        cell = next_of(start[0] * cols + start[1])
+        while cell != -1:
+            path.append(divmod(cell, cols))
+            cell = next_of(cell)
+        return SearchResult(path, cost, 0, 0, 0)
+
+    def save(self, path):
+        # Both arrays go in one .npy, in a dtype that holds both
+        dtype = np.result_type(self.distance, self.next_cell)
+        np.save(path, np.stack([self.distance.astype(dtype), self.next_cell.astype(dtype)]))
+
+
+def load_field(path, target):
+    fields = np.load(path)
+    return DistanceField(target, fields[0], fields[1])
+
+
+def distance_field(grid, target):
+    """DistanceField of a CostGrid, by Dijkstra from the target with a ring of buckets (see PathWeighted.dial).
+
+    Moving from a cell v into its neighbour u costs cost[u], so the search goes backwards along every edge.
+    """
+    t = grid.node(target)
+    if not grid.cost[t]:
+        raise ValueError("%s is a barrier" % (target,))
+
+    cost = grid.cost
+    offsets = grid.offsets
+    distance = [INF] * grid.size
+    next_node = [-1] * grid.size
+
+    ring = grid.max_cost + 1
+    buckets = [[] for _ in range(ring)]
+    distance[t] = 0
+    buckets[0].append(t)
+    size = 1
+    d = 0
+    expansions = 0
+    while size:
+        bucket = buckets[d % ring]
+        while not bucket:
+            d += 1
+            bucket = buckets[d % ring]
+        u = bucket.pop()
+        size -= 1
+        if distance[u] < d:
+            # Stale entry, u was pushed again with a lower distance and has already been expanded
+            continue
+        expansions += 1
+
+        through = d + cost[u]
+        for offset in offsets:
+            v = u + offset
+            if cost[v] and through < distance[v]:
+                distance[v] = through
+                next_node[v] = u
+                buckets[through % ring].append(v)
+                size += 1
+
+    # Back to (rows, cols) arrays without the border, in the smallest int type the values fit in
+    cells = grid.rows * grid.cols
+    distance_type = np.int32 if grid.max_cost * cells < 2 ** 31 else np.int64
+    next_type = np.int32 if cells < 2 ** 31 else np.int64
+
+    distance = np.array(distance).reshape(grid.rows + 2, grid.width)[1:-1, 1:-1]
+    distance = np.where(np.isinf(distance), -1, distance).astype(distance_type)
+
+    next_node = np.array(next_node, dtype=np.int64).reshape(grid.rows + 2, grid.width)[1:-1, 1:-1]
+    row, col = np.divmod(next_node, grid.width)
+    next_cell = np.where(next_node == -1, -1, (row - 1) * grid.cols + col - 1).astype(next_type)
+
+    return DistanceField(target, distance, next_cell, expansions)
+
+
+def grid_fingerprint(grid):
+    """Short hash of the shape and cell costs of a CostGrid."""
+    digest = hashlib.sha1(np.array([grid.rows, grid.cols], dtype=np.int64).tobytes())
+    digest.update(np.asarray(grid.cost, dtype=np.int64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class FieldCache:
+    """Least recently used DistanceFields over one CostGrid, holding at most max_bytes of them in memory.
+
+    With a directory the fields are also saved there and loaded back before recomputing one. The file names
+    carry a fingerprint of the grid costs, so fields saved for another grid (or before a cost changed) are
+    never loaded. The directory belongs to this grid, changing a cell cost deletes the fields in it along with
+    the ones in memory.
+    """
+
+    def __init__(self, grid, max_bytes=256 * 2 ** 20, directory=None):
+        self.grid = grid
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.fields = OrderedDict()  # target -> DistanceField, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.fingerprint = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.fingerprint = grid_fingerprint(grid)
+
+    def filename(self, target):
+        return os.path.join(self.directory, "field_%s_%d_%d.npy" % ((self.fingerprint,) + tuple(target)))
+
+    def get(self, target):
+        target = tuple(target)
+        if target in self.fields:
+            self.hits += 1
+            self.fields.move_to_end(target)
+            return self.fields[target]
+
+        self.misses += 1
+        if self.directory is not None and os.path.exists(self.filename(target)):
+            field = load_field(self.filename(target), target)
+        else:
+            field = distance_field(self.grid, target)
+            if self.directory is not None:
+                field.save(self.filename(target))
+
+        self.fields[target] = field
+        self.nbytes += field.nbytes
+        # The newest field is kept even if it is over the cap on its own
+        while self.nbytes > self.max_bytes and len(self.fields) > 1:
+            _, old = self.fields.popitem(last=False)
+            self.nbytes -= old.nbytes
+        return field
+
+    def path(self, start, end):
+        return self.get(end).path(start)
+
+    def set_cost(self, pos, cost):
+        """Changes a cell cost on the grid and drops every field, they may all go through the cell."""
+        node = self.grid.node(pos)
+        before = self.grid.cost[node]
+        self.grid.set_cost(pos, cost)
+        if self.grid.cost[node] != before:
+            self.invalidate()
+
+    def invalidate(self):
+        if self.directory is not None:
+            # Only the fields of this grid, other grids may share the directory
+            prefix = "field_%s_" % self.fingerprint
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix) and name.endswith(".npy"):
+                    os.remove(os.path.join(self.directory, name))
+            self.fingerprint = grid_fingerprint(self.grid)
+        self.fields.clear()
+        self.nbytes = 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Answer queries to a few shared targets from distance fields.")
+    parser.add_argument("--size", type=int, default=500, help="Rows and columns of the random terrain")
+    parser.add_argument("--max-z", type=int, default=9, help="Highest z of the random terrain")
+    parser.add_argument("--targets", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--max-mb", type=float, default=256, help="Memory cap of the field cache")
+    parser.add_argument("--directory", help="Where to save the fields")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    grid = CostGrid(random_terrain(args.size, args.max_z, rng))
+    cache = FieldCache(grid, int(args.max_mb * 2 ** 20), args.directory)
+
+    targets = [tuple(int(v) for v in cell) for cell in rng.integers(0, args.size, (args.targets, 2))]
+    starts = [tuple(int(v) for v in cell) for cell in rng.integers(0, args.size, (args.queries, 2))]
+
+    start = time.perf_counter()
+    for i, cell in enumerate(starts):
+        cache.path(cell, targets[i % len(targets)])
+    elapsed = time.perf_counter() - start
+    print("%d queries to %d targets in %.2f s, %d fields built or loaded, %.1f MB cached"
+          % (len(starts), len(targets), elapsed, cache.misses, cache.nbytes / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
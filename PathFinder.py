@@ -1,7 +1,13 @@
 import pygame
-from queue import PriorityQueue
+import numpy as np
+
+from DoubleBuffer import DoubleBuffer, SimulationThread
+from PathEngine import INF, Grid, astar, bidirectional_astar, occupancy_from_spots
+from PathHierarchy import PathHierarchy
+from PathReplan import DStarLite
 
 W = 600
+FPS = 60
 win = pygame.display.set_mode((W, W))
 pygame.display.set_caption("Path finding algorithm")
 pygame.init()
@@ -71,81 +77,71 @@ class Spot:
     def draw(self, win):
         pygame.draw.rect(win, self.colour, (self.x, self.y, self.width, self.width))
 
-    def update_neighbours(self, grid):
-        self.neighbours = []
-        if self.row < self.total_rows - 1 and not grid[self.row + 1][self.col].is_barrier():  # DOWN
-            self.neighbours.append(grid[self.row + 1][self.col])
-
-        if self.row > 0 and not grid[self.row - 1][self.col].is_barrier():  # UP
-            self.neighbours.append(grid[self.row - 1][self.col])
 
-        if self.col < self.total_rows - 1 and not grid[self.row][self.col + 1].is_barrier():  # Right
-            self.neighbours.append(grid[self.row][self.col + 1])
+def algorithm(draw, grid, start, end, search=astar):
+    # The search runs on a headless search from PathEngine, A* unless another is given. The hooks colour the
+    # spots as it goes and draw() is called after every expansion.
+    def on_open(pos):
+        spot = grid[pos[0]][pos[1]]
+        if spot != end:
+            spot.make_open()
 
-        if self.row > 0 and not grid[self.row][self.col - 1].is_barrier():  # Left
-            self.neighbours.append(grid[self.row][self.col - 1])
+    def on_close(pos):
+        spot = grid[pos[0]][pos[1]]
+        if spot != start and spot != end:
+            spot.make_closed()
+        draw()
 
-    def __lt__(self, other):
+    result = search(Grid(occupancy_from_spots(grid)), start.get_pos(), end.get_pos(), on_open, on_close)
+    if result.path is None:
         return False
 
+    for row, col in reversed(result.path[:-1]):
+        grid[row][col].make_path()
+        draw()
+    end.make_end()
+    return True
 
-def h(p1, p2):
-    x1, y1 = p1
-    x2, y2 = p2
-    return abs(x1-x2) + abs(y1 - y2)
 
+def hierarchical_algorithm(draw, grid, hierarchy, start, end):
+    # HPA* over the clusters of the hierarchy, which is kept in step with the barriers as they are edited
+    result = hierarchy.find_path(start.get_pos(), end.get_pos())
+    if result.path is None:
+        return False
 
-def reconstruct_path(came_from, current, draw):
-    while current in came_from:
-        current = came_from[current]
-        current.make_path()
+    for row, col in reversed(result.path[:-1]):
+        grid[row][col].make_path()
         draw()
+    end.make_end()
+    return True
 
 
-def algorithm(draw, grid, start, end):
-    count = 0
-    open_set = PriorityQueue()
-    open_set.put((0, count, start))
-    came_from = {}
-    g_score = {spot: float("inf") for row in grid for spot in row}
-    g_score[start] = 0
-    f_score = {spot: float("inf") for row in grid for spot in row}
-    f_score[start] = h(start.get_pos(), end.get_pos())
-
-    open_set_hash = {start}
-
-    while not open_set.empty():
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
+def spot_cost(spot):
+    # Cost of moving into a spot for the incremental planner
+    return INF if spot.is_barrier() else 1
 
-        current = open_set.get()[2]
-        open_set_hash.remove(current)
 
-        if current == end:
-            reconstruct_path(came_from, end, draw)
-            end.make_end()
-            return True
+def clear_path(grid):
+    # Removes the open, closed and path colours left by the last search
+    for row in grid:
+        for spot in row:
+            if spot.is_closed() or spot.is_open() or spot.colour == PURPLE:
+                spot.reset()
 
-        for neighbour in current.neighbours:
-            temp_g_score = g_score[current] + 1
 
-            if temp_g_score < g_score[neighbour]:
-                came_from[neighbour] = current
-                g_score[neighbour] = temp_g_score
-                f_score[neighbour] = temp_g_score + h(neighbour.get_pos(), end.get_pos())
-                if neighbour not in open_set_hash:
-                    count += 1
-                    open_set.put((f_score[neighbour], count, neighbour))
-                    open_set_hash.add(neighbour)
-                    neighbour.make_open()
+def replan_algorithm(draw, grid, planner, start, end):
+    # D* Lite keeps its search between runs, so after editing a few barriers only the part of the search they
+    # affect is repaired
+    clear_path(grid)
+    planner.move_start(start.get_pos())
+    result = planner.plan()
+    if result.path is None:
+        return False
 
+    for row, col in reversed(result.path[1:-1]):
+        grid[row][col].make_path()
         draw()
-
-        if current != start:
-            current.make_closed()
-
-    return False
+    return True
 
 
 def make_grid(rows, width):
@@ -168,11 +164,19 @@ def draw_grid(win, rows, width):
             pygame.draw.line(win, GREY, (j*gap, 0), (j*gap, width))
 
 
-def draw(win, grid, rows, width):
+def write_colours(grid, colours):
+    # Snapshot of the spot colours, colours[row][col] = spot.colour
+    for i, row in enumerate(grid):
+        colours[i] = [spot.colour for spot in row]
+
+
+def draw(win, colours, rows, width):
+    # The snapshot has one pixel per spot, which is scaled up to the spot width
+    gap = width // rows
+    surface = pygame.Surface((rows, rows))
+    pygame.surfarray.blit_array(surface, colours)
     win.fill(WHITE)
-    for row in grid:
-        for spot in row:
-            spot.draw(win)
+    win.blit(pygame.transform.scale(surface, (rows * gap, rows * gap)), (0, 0))
     draw_grid(win, rows, width)
     pygame.display.update()
 
@@ -188,15 +192,49 @@ def get_clicked_position(pos, rows, width):
 
 def main(win, width):
     ROWS = 50
+    CLUSTER_SIZE = 10
     grid = make_grid(ROWS, width)
+    hierarchy = PathHierarchy(np.zeros((ROWS, ROWS), dtype=bool), CLUSTER_SIZE)
+    planner = None
 
     start = None
     end = None
 
+    # The search runs on a worker thread and publishes the spot colours, which are drawn at a capped frame rate
+    buffer = DoubleBuffer(np.zeros((ROWS, ROWS, 3), dtype=np.uint8), np.zeros((ROWS, ROWS, 3), dtype=np.uint8),
+                          interval=1 / FPS)
+    worker = None
+    clock = pygame.time.Clock()
+
+    def write(colours):
+        write_colours(grid, colours)
+
+    def search():
+        algorithm(lambda: buffer.publish(write), grid, start, end)
+        return False
+
+    def bidirectional_search():
+        algorithm(lambda: buffer.publish(write), grid, start, end, bidirectional_astar)
+        return False
+
+    def hierarchical_search():
+        hierarchical_algorithm(lambda: buffer.publish(write), grid, hierarchy, start, end)
+        return False
+
+    def incremental_search():
+        replan_algorithm(lambda: buffer.publish(write), grid, planner, start, end)
+        return False
+
     run = True
     started = False
     while run:
-        draw(win, grid, ROWS, width)
+        started = worker is not None and worker.is_alive()
+        if not started:
+            buffer.publish(write, force=True)
+        with buffer.front() as colours:
+            draw(win, colours, ROWS, width)
+        clock.tick(FPS)
+
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 run = False
@@ -210,33 +248,58 @@ def main(win, width):
                 if not start and spot != end:
                     start = spot
                     start.make_start()
+                    # The spot may have been a barrier
+                    hierarchy.set_barrier((row, col), False)
                 elif not end and spot != start:
                     end = spot
                     end.make_end()
+                    hierarchy.set_barrier((row, col), False)
                 elif spot != end and spot != start:
                     spot.make_barrier()
+                    hierarchy.set_barrier((row, col), True)
+                if planner is not None:
+                    planner.set_cost((row, col), spot_cost(spot))
 
             elif pygame.mouse.get_pressed()[2]:
                 pos = pygame.mouse.get_pos()
                 row, col = get_clicked_position(pos, ROWS, width)
                 spot = grid[row][col]
                 spot.reset()
+                hierarchy.set_barrier((row, col), False)
                 if spot == start:
                     start = None
                 elif spot == end:
                     end = None
+                if planner is not None:
+                    planner.set_cost((row, col), spot_cost(spot))
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE and not started:
-                    for row in grid:
-                        for spot in row:
-                            spot.update_neighbours(grid)
-                    algorithm(lambda: draw(win, grid, ROWS, width), grid, start, end)
+                    worker = SimulationThread(search, write, buffer)
+                    worker.start()
+
+                if event.key == pygame.K_b and not started:
+                    worker = SimulationThread(bidirectional_search, write, buffer)
+                    worker.start()
+
+                if event.key == pygame.K_h and not started:
+                    worker = SimulationThread(hierarchical_search, write, buffer)
+                    worker.start()
+
+                if event.key == pygame.K_d and not started and start and end:
+                    # The planner is built once per end spot and then only told about the cells that change
+                    if planner is None or planner.pos(planner.goal) != end.get_pos():
+                        costs = [[spot_cost(spot) for spot in row] for row in grid]
+                        planner = DStarLite(costs, start.get_pos(), end.get_pos())
+                    worker = SimulationThread(incremental_search, write, buffer)
+                    worker.start()
 
                 if event.key == pygame.K_c:
                     start = None
                     end = None
                     grid = make_grid(ROWS, width)
+                    hierarchy = PathHierarchy(np.zeros((ROWS, ROWS), dtype=bool), CLUSTER_SIZE)
+                    planner = None
 
     pygame.quit()
 
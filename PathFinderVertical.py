@@ -1,6 +1,11 @@
 import pygame
 import math
-from queue import PriorityQueue
+import argparse
+
+from PathField import FieldCache
+from PathReplan import DStarLite
+from PathTerrain import TerrainCosts, load_heights
+from PathWeighted import CostGrid, dial
 
 W = 600
 win = pygame.display.set_mode((W, W))
@@ -77,81 +82,76 @@ class Spot:
             text_surface = my_font.render(str(self.z), False, WHITE)
             win.blit(text_surface, (self.x + 4, self.y))
 
-    def update_neighbours(self, grid):
-        self.neighbours = []
-        if self.row < self.total_rows - 1:  # DOWN
-            self.neighbours.append(grid[self.row + 1][self.col])
-
-        if self.row > 0:  # UP
-            self.neighbours.append(grid[self.row - 1][self.col])
-
-        if self.col < self.total_rows - 1:  # Right
-            self.neighbours.append(grid[self.row][self.col + 1])
-
-        if self.row > 0:  # Left
-            self.neighbours.append(grid[self.row][self.col - 1])
-
-    def __lt__(self, other):
-        return False
 
+def spot_cost(spot):
+    # Cost of moving into a spot, raised spots are harder to cross
+    return spot.z + 1
 
-def h(p1, p2):
-    x1, y1 = p1
-    x2, y2 = p2
-    return abs(x1-x2) + abs(y1 - y2)
 
-
-def reconstruct_path(came_from, current, draw):
-    while current in came_from:
-        current = came_from[current]
-        current.make_path()
-        draw()
+def clear_path(grid):
+    # Removes the open, closed and path colours left by the last search, raised spots go back to black
+    for row in grid:
+        for spot in row:
+            if spot.is_closed() or spot.is_open() or spot.colour == PURPLE:
+                spot.colour = BLACK if spot.z > 0 else WHITE
 
 
 def algorithm(draw, grid, start, end):
-    count = 0
-    open_set = PriorityQueue()
-    open_set.put((0, count, start))
-    came_from = {}
-    g_score = {spot: float("inf") for row in grid for spot in row}
-    g_score[start] = 0
-    f_score = {spot: float("inf") for row in grid for spot in row}
-    f_score[start] = h(start.get_pos(), end.get_pos())
-
-    open_set_hash = {start}
-
-    while not open_set.empty():
+    # The search runs on the bucket queue A* in PathWeighted, moving into a spot costs z + 1. The hooks colour
+    # the spots as it goes and draw() is called after every expansion.
+    def on_open(pos):
+        spot = grid[pos[0]][pos[1]]
+        if spot != end:
+            spot.make_open()
+
+    def on_close(pos):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
 
-        current = open_set.get()[2]
-        open_set_hash.remove(current)
+        spot = grid[pos[0]][pos[1]]
+        if spot != start and spot != end:
+            spot.make_closed()
+        draw()
 
-        if current == end:
-            reconstruct_path(came_from, end, draw)
-            end.make_end()
-            return True
+    costs = [[spot_cost(spot) for spot in row] for row in grid]
+    result = dial(CostGrid(costs), start.get_pos(), end.get_pos(), on_open, on_close)
+    if result.path is None:
+        return False
+
+    for row, col in reversed(result.path[:-1]):
+        grid[row][col].make_path()
+        draw()
+    end.make_end()
+    return True
 
-        for neighbour in current.neighbours:
-            temp_g_score = g_score[current] + neighbour.z + 1
 
-            if temp_g_score < g_score[neighbour]:
-                came_from[neighbour] = current
-                g_score[neighbour] = temp_g_score
-                f_score[neighbour] = temp_g_score + h(neighbour.get_pos(), end.get_pos())
-                if neighbour not in open_set_hash:
-                    count += 1
-                    open_set.put((f_score[neighbour], count, neighbour))
-                    open_set_hash.add(neighbour)
-                    neighbour.make_open()
+def replan_algorithm(draw, grid, planner, start, end):
+    # D* Lite keeps its search between runs, so after raising or lowering a few spots only the part of the
+    # search they affect is repaired
+    clear_path(grid)
+    planner.move_start(start.get_pos())
+    result = planner.plan()
+    if result.path is None:
+        return False
 
+    for row, col in reversed(result.path[1:-1]):
+        grid[row][col].make_path()
         draw()
+    return True
 
-        if current != start:
-            current.make_closed()
 
-    return False
+def field_algorithm(draw, grid, fields, start, end):
+    # The distance field to the end spot is built once and kept in the cache, every start after that only walks it
+    clear_path(grid)
+    result = fields.path(start.get_pos(), end.get_pos())
+    if result.path is None:
+        return False
+
+    for row, col in reversed(result.path[1:-1]):
+        grid[row][col].make_path()
+        draw()
+    return True
 
 
 def make_grid(rows, width):
@@ -183,6 +183,17 @@ def draw(win, grid, rows, width):
     pygame.display.update()
 
 
+def load_terrain(grid, costs):
+    # Raises every spot to match the top left corner of a cost map, such as a PathTerrain.TerrainCosts.
+    # grid[i][j] is drawn at x = i, y = j, so it takes the cost at row j, column i of the map.
+    block = costs[:len(grid[0])]
+    for i, row in enumerate(grid):
+        for j, spot in enumerate(row):
+            if j < block.shape[0] and i < block.shape[1]:
+                spot.z = int(block[j, i]) - 1
+                spot.colour = BLACK if spot.z > 0 else WHITE
+
+
 def get_clicked_position(pos, rows, width):
     gap = width // rows
     y, x = pos
@@ -192,9 +203,14 @@ def get_clicked_position(pos, rows, width):
     return row, col
 
 
-def main(win, width):
+def main(win, width, terrain_costs=None):
+    # terrain_costs is an optional PathTerrain.TerrainCosts that the spots start raised to
     ROWS = 50
     grid = make_grid(ROWS, width)
+    if terrain_costs is not None:
+        load_terrain(grid, terrain_costs)
+    planner = None
+    fields = None
 
     start = None
     end = None
@@ -222,6 +238,10 @@ def main(win, width):
                 elif spot != end and spot != start:
                     spot.colour = BLACK
                     spot.z += 1
+                if planner is not None:
+                    planner.set_cost((row, col), spot_cost(spot))
+                if fields is not None:
+                    fields.set_cost((row, col), spot_cost(spot))
 
             elif pygame.mouse.get_pressed()[2]:
                 pos = pygame.mouse.get_pos()
@@ -239,21 +259,49 @@ def main(win, width):
                         start = None
                     elif spot == end:
                         end = None
+                if planner is not None:
+                    planner.set_cost((row, col), spot_cost(spot))
+                if fields is not None:
+                    fields.set_cost((row, col), spot_cost(spot))
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE and not started:
-                    for row in grid:
-                        for spot in row:
-                            spot.update_neighbours(grid)
                     algorithm(lambda: draw(win, grid, ROWS, width), grid, start, end)
 
+                if event.key == pygame.K_d and not started and start and end:
+                    # The planner is built once per end spot and then only told about the spots that change
+                    if planner is None or planner.pos(planner.goal) != end.get_pos():
+                        spot_costs = [[spot_cost(spot) for spot in row] for row in grid]
+                        planner = DStarLite(spot_costs, start.get_pos(), end.get_pos())
+                    replan_algorithm(lambda: draw(win, grid, ROWS, width), grid, planner, start, end)
+
+                if event.key == pygame.K_f and not started and start and end:
+                    if fields is None:
+                        fields = FieldCache(CostGrid([[spot_cost(spot) for spot in row] for row in grid]))
+                    field_algorithm(lambda: draw(win, grid, ROWS, width), grid, fields, start, end)
+
                 if event.key == pygame.K_c:
                     start = None
                     end = None
                     grid = make_grid(ROWS, width)
+                    if terrain_costs is not None:
+                        load_terrain(grid, terrain_costs)
+                    planner = None
+                    fields = None
 
     pygame.quit()
 
 
-main(win, W)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Weighted path finding on a grid of raised spots.")
+    parser.add_argument("terrain", nargs="?", help="PNG, .npy or raw heightmap the spots start raised to")
+    parser.add_argument("--shape", type=int, nargs=2, help="Rows and columns of a raw file")
+    parser.add_argument("--dtype", default="uint16", help="Element type of a raw file")
+    parser.add_argument("--scale", type=float, default=1.0, help="z is the height times scale")
+    return parser.parse_args(argv)
+
+
+args = parse_args()
+main(win, W, TerrainCosts(load_heights(args.terrain, args.shape, args.dtype), args.scale)
+     if args.terrain is not None else None)
 
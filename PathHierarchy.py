@@ -0,0 +1,335 @@
+# Hierarchical path finding (HPA*) for large 4-connected grids.
+# The grid is cut into clusters of cluster_size x cluster_size cells. Wherever two neighbouring clusters share
+# a run of free cells along their border, one or two transitions are placed across it; the cells either side
+# of a transition are abstract nodes joined by an edge of cost 1. Inside each cluster the distances between
+# its abstract nodes are worked out once with a BFS that stays in the cluster.
+#
+# A query joins the start and end to the abstract nodes of their clusters, searches the small abstract graph
+# and then refines each abstract edge back into cells. Paths are close to, but not always exactly, the
+# shortest. Editing a cell only rebuilds the borders and distances of the cluster it is in, plus a neighbour
+# whose shared border changed.
+
+import heapq
+import numpy as np
+
+from PathEngine import INF, Grid, SearchResult
+
+MAX_ENTRANCE = 6  # Runs of free border cells at least this long get a transition at each end
+
+
+class PathHierarchy:
+    """Abstract graph over a Grid, kept up to date as barriers are added and removed."""
+
+    def __init__(self, occupancy, cluster_size=10):
+        self.grid = Grid(occupancy)
+        self.cluster_size = cluster_size
+        self.cluster_rows = -(-self.grid.rows // cluster_size)
+        self.cluster_cols = -(-self.grid.cols // cluster_size)
+
+        self.transitions = {}  # (cluster, neighbouring cluster) -> list of (node, node) across the border
+        self.inter = {}  # node -> set of nodes in other clusters, one step away
+        self.intra = {}  # cluster -> {node: {node: distance}} inside the cluster
+        self.local = {}  # cluster -> cached local_grid
+
+        for cluster in self.clusters():
+            for other in self.neighbouring_clusters(cluster):
+                if cluster < other:
+                    self.build_border(cluster, other)
+        for cluster in self.clusters():
+            self.build_intra(cluster)
+
+    def clusters(self):
+        return [(i, j) for i in range(self.cluster_rows) for j in range(self.cluster_cols)]
+
+    def cluster_of(self, node):
+        row, col = self.grid.pos(node)
+        return row // self.cluster_size, col // self.cluster_size
+
+    def bounds(self, cluster):
+        """First and last (exclusive) row and column of a cluster."""
+        i, j = cluster
+        c = self.cluster_size
+        return i * c, min((i + 1) * c, self.grid.rows), j * c, min((j + 1) * c, self.grid.cols)
+
+    def neighbouring_clusters(self, cluster):
+        i, j = cluster
+        for a, b in ((i + 1, j), (i - 1, j), (i, j + 1), (i, j - 1)):
+            if 0 <= a < self.cluster_rows and 0 <= b < self.cluster_cols:
+                yield a, b
+
+    def nodes_in(self, cluster):
+        return self.intra.get(cluster, {}).keys()
+
+    def border_nodes(self, cluster):
+        # Abstract nodes of a cluster, found from the transitions on its borders
+        nodes = set()
+        for other in self.neighbouring_clusters(cluster):
+            key = (cluster, other) if cluster < other else (other, cluster)
+            for a, b in self.transitions.get(key, []):
+                nodes.add(a if self.cluster_of(a) == cluster else b)
+        return nodes
+
+    def build_border(self, a, b):
+        """Places the transitions across the border between clusters a < b."""
+        grid = self.grid
+        key = (a, b)
+        for u, v in self.transitions.get(key, []):
+            self.inter[u].discard(v)
+            self.inter[v].discard(u)
+
+        r0, r1, c0, c1 = self.bounds(a)
+        if b[0] == a[0] + 1:
+            # b is below a, the border runs along the last row of a
+            pairs = [(grid.node((r1 - 1, col)), grid.node((r1, col))) for col in range(c0, c1)]
+        else:
+            # b is right of a, the border runs down the last column of a
+            pairs = [(grid.node((row, c1 - 1)), grid.node((row, c1))) for row in range(r0, r1)]
+
+        transitions = []
+        run = []
+        for pair in pairs + [None]:
+            if pair is not None and not grid.blocked[pair[0]] and not grid.blocked[pair[1]]:
+                run.append(pair)
+                continue
+            if len(run) >= MAX_ENTRANCE:
+                transitions += [run[0], run[-1]]
+            elif run:
+                transitions.append(run[len(run) // 2])
+            run = []
+
+        self.transitions[key] = transitions
+        for u, v in transitions:
+            self.inter.setdefault(u, set()).add(v)
+            self.inter.setdefault(v, set()).add(u)
+
+    def local_grid(self, cluster):
+        """Barrier flags of just the cluster with its own border of barriers, and the width of a row."""
+        if cluster not in self.local:
+            grid = self.grid
+            r0, r1, c0, c1 = self.bounds(cluster)
+            width = c1 - c0 + 2
+            blocked = [True] * width
+            for row in range(r0, r1):
+                first = grid.node((row, c0))
+                blocked += [True] + grid.blocked[first:first + c1 - c0] + [True]
+            blocked += [True] * width
+            self.local[cluster] = blocked, width
+        return self.local[cluster]
+
+    def to_local(self, node, cluster):
+        row, col = self.grid.pos(node)
+        r0, _, c0, _ = self.bounds(cluster)
+        return (row - r0 + 1) * self.local_grid(cluster)[1] + col - c0 + 1
+
+    def to_global(self, local, cluster):
+        row, col = divmod(local, self.local_grid(cluster)[1])
+        r0, _, c0, _ = self.bounds(cluster)
+        return self.grid.node((row - 1 + r0, col - 1 + c0))
+
+    def bfs(self, source, cluster):
+        """Distance (-1 if unreachable) and parent lists, indexed by local cell, of a BFS from source that
+        doesn't leave the cluster."""
+        blocked, width = self.local_grid(cluster)
+        first = self.to_local(source, cluster)
+        distance = [-1] * len(blocked)
+        parent = [-1] * len(blocked)
+        distance[first] = 0
+        queue = [first]
+        for current in queue:
+            next_distance = distance[current] + 1
+            for d in (width, -width, 1, -1):
+                neighbour = current + d
+                if distance[neighbour] == -1 and not blocked[neighbour]:
+                    distance[neighbour] = next_distance
+                    parent[neighbour] = current
+                    queue.append(neighbour)
+        return distance, parent
+
+    def distances(self, source, cluster, targets):
+        """{target: distance} for the targets in cluster that can be reached from source inside it."""
+        distance, _ = self.bfs(source, cluster)
+        found = {}
+        for target in targets:
+            d = distance[self.to_local(target, cluster)]
+            if d != -1:
+                found[target] = d
+        return found
+
+    def build_intra(self, cluster):
+        """Distances between every pair of abstract nodes of a cluster.
+
+        All the BFSs are run together, one layer per step, on a (nodes, cells) array of reached flags.
+        """
+        nodes = sorted(self.border_nodes(cluster))
+        if not nodes:
+            self.intra[cluster] = {}
+            return
+
+        blocked, width = self.local_grid(cluster)
+        free = ~np.array(blocked, dtype=bool).reshape(-1, width)
+        sources = np.array([self.to_local(node, cluster) for node in nodes])
+        k = len(nodes)
+
+        distance = np.full((k, free.size), -1, dtype=np.int32)
+        distance[np.arange(k), sources] = 0
+        reached = distance == 0
+        frontier = reached.reshape(k, *free.shape)
+        d = 0
+        while frontier.any():
+            d += 1
+            grown = np.zeros_like(frontier)
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            grown[:, :, 1:] |= frontier[:, :, :-1]
+            grown[:, :, :-1] |= frontier[:, :, 1:]
+            grown &= free
+            grown &= ~reached.reshape(frontier.shape)
+            frontier = grown
+            new = grown.reshape(k, -1)
+            reached |= new
+            distance[new] = d
+
+        between = distance[:, sources]
+        self.intra[cluster] = {
+            node: {nodes[j]: int(between[i, j]) for j in range(k) if j != i and between[i, j] != -1}
+            for i, node in enumerate(nodes)
+        }
+
+    def set_barrier(self, pos, barrier=True):
+        """Adds or removes a barrier and rebuilds only the clusters the change can affect."""
+        node = self.grid.node(pos)
+        if self.grid.blocked[node] == bool(barrier):
+            return
+        self.grid.set_barrier(pos, barrier)
+
+        cluster = self.cluster_of(node)
+        self.local.pop(cluster, None)
+        rebuild = {cluster}
+        for other in self.neighbouring_clusters(cluster):
+            key = (cluster, other) if cluster < other else (other, cluster)
+            before = list(self.transitions.get(key, []))
+            self.build_border(*key)
+            if self.transitions[key] != before:
+                rebuild.add(other)
+        for c in rebuild:
+            self.build_intra(c)
+
+    def local_path(self, a, b):
+        """Cells from a to b inside the cluster of a, or None."""
+        if b in self.inter.get(a, ()):
+            return [a, b]
+        cluster = self.cluster_of(a)
+        distance, parent = self.bfs(a, cluster)
+        local = self.to_local(b, cluster)
+        if distance[local] == -1:
+            return None
+        path = [local]
+        while parent[path[-1]] != -1:
+            path.append(parent[path[-1]])
+        path.reverse()
+        return [self.to_global(node, cluster) for node in path]
+
+    def find_path(self, start, end):
+        """Searches the abstract graph from start to end and refines the result into cells."""
+        grid = self.grid
+        s = grid.node(start)
+        t = grid.node(end)
+        if grid.blocked[s] or grid.blocked[t]:
+            return SearchResult(None, INF, 0, 0, 0)
+
+        cs = self.cluster_of(s)
+        ct = self.cluster_of(t)
+        start_edges = self.distances(s, cs, set(self.nodes_in(cs)) | ({t} if cs == ct else set()))
+        end_edges = self.distances(t, ct, self.nodes_in(ct))
+
+        def neighbours(node):
+            if node == s:
+                yield from start_edges.items()
+                for other in self.inter.get(s, ()):
+                    yield other, 1
+                return
+            yield from self.intra[self.cluster_of(node)].get(node, {}).items()
+            for other in self.inter.get(node, ()):
+                yield other, 1
+            if node in end_edges:
+                yield t, end_edges[node]
+
+        end_row, end_col = grid.pos(t)
+
+        def h(node):
+            row, col = grid.pos(node)
+            return abs(row - end_row) + abs(col - end_col)
+
+        # Same as astar, ties in f go to the smaller h
+        g = {s: 0}
+        came_from = {}
+        closed = set()
+        open_set = [(h(s), h(s), s)]
+        pushes = 1
+        max_open = 1
+        expansions = 0
+        while open_set:
+            _, _, current = heapq.heappop(open_set)
+            if current in closed:
+                continue
+            closed.add(current)
+            expansions += 1
+            if current == t:
+                break
+            for neighbour, cost in neighbours(current):
+                temp_g_score = g[current] + cost
+                if neighbour not in closed and temp_g_score < g.get(neighbour, INF):
+                    g[neighbour] = temp_g_score
+                    came_from[neighbour] = current
+                    h_score = h(neighbour)
+                    heapq.heappush(open_set, (temp_g_score + h_score, h_score, neighbour))
+                    pushes += 1
+            max_open = max(max_open, len(open_set))
+        else:
+            return SearchResult(None, INF, expansions, pushes, max_open)
+
+        abstract = [t]
+        while abstract[-1] != s:
+            abstract.append(came_from[abstract[-1]])
+        abstract.reverse()
+
+        # Every abstract edge either crosses a border or stays inside the cluster of its first node
+        path = [s]
+        for a, b in zip(abstract, abstract[1:]):
+            if a == s and b == t:
+                path += self.local_path(s, t)[1:]
+            elif a == s:
+                path += self.local_path(s, b)[1:]
+            elif b == t:
+                path += self.local_path(t, a)[::-1][1:]
+            else:
+                path += self.local_path(a, b)[1:]
+
+        return SearchResult([grid.pos(node) for node in path], g[t], expansions, pushes, max_open)
+
+
+def main():
+    import time
+    from PathEngine import astar
+
+    rng = np.random.default_rng(0)
+    size = 1000
+    occupancy = rng.random((size, size)) < 0.1
+    occupancy[0, 0] = occupancy[-1, -1] = False
+
+    start = time.perf_counter()
+    hierarchy = PathHierarchy(occupancy, cluster_size=20)
+    print("Built the hierarchy in %.2f s" % (time.perf_counter() - start))
+
+    for name, search in [("HPA*", hierarchy.find_path), ("A*", lambda a, b: astar(hierarchy.grid, a, b))]:
+        start = time.perf_counter()
+        result = search((0, 0), (size - 1, size - 1))
+        print("%-5s %.3f s %s" % (name, time.perf_counter() - start, result))
+
+    start = time.perf_counter()
+    hierarchy.set_barrier((500, 500), True)
+    print("Updated one cell in %.4f s" % (time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
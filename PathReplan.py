@@ -0,0 +1,222 @@
+# Incremental replanning with D* Lite on 4-connected grids.
+# Moving into a cell costs costs[row][col] (inf for a barrier), which covers both PathFinder (1 or a barrier)
+# and PathFinderVertical (z + 1). D* Lite searches backwards from the goal and keeps its g and rhs values
+# between plans. When a cell's cost changes only the nodes whose distance to the goal depends on that cell
+# are put back on the queue, so a single edit is repaired without searching the whole grid again.
+#
+# Koenig and Likhachev, "D* Lite", AAAI 2002 (the optimised version, Figure 4).
+
+import heapq
+import numpy as np
+
+from PathEngine import INF, SearchResult
+
+
+class DStarLite:
+    """Keeps the shortest path from start to goal up to date as cell costs change and the start moves."""
+
+    def __init__(self, costs, start, goal):
+        costs = np.asarray(costs, dtype=float)
+        if (costs < 1).any():
+            raise ValueError("Cell costs must be at least 1 for the Manhattan heuristic to be admissible")
+        self.rows, self.cols = costs.shape
+        self.width = self.cols + 2
+
+        padded = np.full((self.rows + 2, self.cols + 2), INF)
+        padded[1:-1, 1:-1] = costs
+        self.cost = padded.ravel().tolist()
+        self.offsets = (self.width, -self.width, 1, -1)
+
+        self.start = self.node(start)
+        self.start_row, self.start_col = divmod(self.start, self.width)
+        self.goal = self.node(goal)
+        self.last = self.start
+        self.km = 0
+
+        self.expansions = 0  # Nodes expanded and pushed by the last call to plan
+        self.pushes = 0
+
+        self.g = [INF] * len(self.cost)
+        self.rhs = [INF] * len(self.cost)
+        self.rhs[self.goal] = 0
+        self.queue = []
+        self.queued = {}  # node -> key it is on the queue with; heap entries with any other key are stale
+        self.push(self.goal, self.calculate_key(self.goal))
+
+    def node(self, pos):
+        row, col = pos
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise ValueError("%s is outside the %d x %d grid" % (pos, self.rows, self.cols))
+        return (row + 1) * self.width + col + 1
+
+    def pos(self, node):
+        row, col = divmod(node, self.width)
+        return row - 1, col - 1
+
+    def h(self, a, b):
+        ra, ca = divmod(a, self.width)
+        rb, cb = divmod(b, self.width)
+        return abs(ra - rb) + abs(ca - cb)
+
+    def calculate_key(self, s):
+        # h(start, s) is written out, this is called for every node that is touched
+        m = min(self.g[s], self.rhs[s])
+        row, col = divmod(s, self.width)
+        return m + abs(row - self.start_row) + abs(col - self.start_col) + self.km, m
+
+    def push(self, s, key):
+        self.queued[s] = key
+        self.pushes += 1
+        heapq.heappush(self.queue, (key, s))
+
+    def top(self):
+        # Drops stale entries off the top of the heap
+        while self.queue:
+            key, s = self.queue[0]
+            if self.queued.get(s) == key:
+                return key, s
+            heapq.heappop(self.queue)
+        return (INF, INF), None
+
+    def best_rhs(self, s):
+        cost = self.cost
+        g = self.g
+        return min(cost[s + d] + g[s + d] for d in self.offsets)
+
+    def update_vertex(self, u):
+        if self.g[u] != self.rhs[u]:
+            self.push(u, self.calculate_key(u))
+        else:
+            self.queued.pop(u, None)
+
+    def compute_shortest_path(self):
+        g = self.g
+        rhs = self.rhs
+        cost = self.cost
+        while True:
+            k_old, u = self.top()
+            start_key = self.calculate_key(self.start)
+            if not (k_old < start_key or rhs[self.start] > g[self.start]):
+                return
+            if u is None:
+                return
+
+            self.expansions += 1
+            k_new = self.calculate_key(u)
+            if k_old < k_new:
+                self.push(u, k_new)
+            elif g[u] > rhs[u]:
+                g[u] = rhs[u]
+                self.queued.pop(u, None)
+                for d in self.offsets:
+                    s = u + d
+                    if s != self.goal and cost[s] != INF:
+                        rhs[s] = min(rhs[s], cost[u] + g[u])
+                        self.update_vertex(s)
+            else:
+                g_old = g[u]
+                g[u] = INF
+                for s in [u + d for d in self.offsets] + [u]:
+                    if s != self.goal and cost[s] != INF and (s == u or rhs[s] == cost[u] + g_old):
+                        rhs[s] = self.best_rhs(s)
+                    self.update_vertex(s)
+
+    def set_cost(self, pos, new_cost):
+        """Changes the cost of moving into a cell (inf for a barrier). Call plan() afterwards to repair the path."""
+        v = self.node(pos)
+        old_cost = self.cost[v]
+        new_cost = float(new_cost)
+        if new_cost == old_cost:
+            return
+        if new_cost < 1:
+            raise ValueError("Cell costs must be at least 1")
+        self.cost[v] = new_cost
+
+        if old_cost == INF and v != self.goal:
+            # v was a barrier, so its own g and rhs were never kept up to date
+            self.g[v] = INF
+            self.rhs[v] = self.best_rhs(v)
+            self.update_vertex(v)
+
+        # The cost of every edge into v changed
+        for d in self.offsets:
+            u = v + d
+            if u == self.goal or self.cost[u] == INF:
+                continue
+            if new_cost < old_cost:
+                self.rhs[u] = min(self.rhs[u], new_cost + self.g[v])
+            elif self.rhs[u] == old_cost + self.g[v]:
+                self.rhs[u] = self.best_rhs(u)
+            self.update_vertex(u)
+
+        if new_cost == INF and v != self.goal:
+            # The goal keeps g = rhs = 0 even as a barrier, only the edges into it change and they were handled
+            # above, so clearing it again needs nothing more
+            self.g[v] = self.rhs[v] = INF
+            self.queued.pop(v, None)
+
+    def move_start(self, pos):
+        """Moves the start, e.g. as an agent walks along the path."""
+        new_start = self.node(pos)
+        self.km += self.h(self.last, new_start)
+        self.last = new_start
+        self.start = new_start
+        self.start_row, self.start_col = divmod(new_start, self.width)
+
+    def plan(self):
+        """Repairs the search and returns the current path from start to goal."""
+        self.expansions = 0
+        self.pushes = 0
+        self.compute_shortest_path()
+
+        s = self.start
+        if self.rhs[s] == INF or self.cost[s] == INF:
+            return SearchResult(None, INF, self.expansions, self.pushes, len(self.queued))
+
+        # Walk down the g values, each step goes to the neighbour with the lowest cost + g. The start itself
+        # may be left with g > rhs, its cost to the goal is rhs.
+        path = [s]
+        total = 0
+        while s != self.goal and len(path) <= len(self.cost):
+            s = min((s + d for d in self.offsets), key=lambda n: self.cost[n] + self.g[n])
+            total += self.cost[s]
+            path.append(s)
+        if s != self.goal:
+            raise RuntimeError("D* Lite path did not reach the goal")
+        return SearchResult([self.pos(n) for n in path], total, self.expansions, self.pushes, len(self.queued))
+
+
+def main():
+    import time
+
+    rng = np.random.default_rng(0)
+    size = 1000
+    costs = np.where(rng.random((size, size)) < 0.15, INF, 1.0)
+    costs[0, 0] = costs[-1, -1] = 1
+
+    planner = DStarLite(costs, (0, 0), (size - 1, size - 1))
+    start = time.perf_counter()
+    result = planner.plan()
+    print("First plan %.2f s %s" % (time.perf_counter() - start, result))
+
+    # Block cells on the current path one at a time, each time repairing the plan
+    for k in range(5):
+        pos = result.path[len(result.path) // 2 + 7 * k]
+        start = time.perf_counter()
+        planner.set_cost(pos, INF)
+        result = planner.plan()
+        print("Blocked %s, replanned in %.4f s %s" % (pos, time.perf_counter() - start, result))
+
+    # Blocking the goal and clearing it again must give back the same cost
+    goal = (size - 1, size - 1)
+    planner.set_cost(goal, INF)
+    blocked = planner.plan()
+    planner.set_cost(goal, 1)
+    cleared = planner.plan()
+    print("Goal blocked %s, cleared %s" % (blocked, cleared))
+    if blocked.path is not None or cleared.cost != result.cost:
+        raise RuntimeError("Blocking and clearing the goal changed the plan")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Terrain for the weighted searches in PathWeighted, loaded from heightmaps or cost maps on disk.
+# PNG images are read with pygame, .npy files are memory mapped and raw files are memory mapped with a given shape
+# and dtype. TerrainCosts turns heights into the z + 1 costs of PathFinderVertical one block of rows at a time,
+# so loading never makes a full size float copy of the tile or a Spot per cell. The searches themselves still
+# need memory for every cell though: CostGrid keeps the costs as a flat list of ints (8 bytes a cell) and dial
+# adds g, came_from and closed lists of the same length, around 2.7 GB for a 10k x 10k tile.
+#
+# Example:
+#   python PathTerrain.py tile.raw --shape 10000 10000 --dtype uint16 --scale 0.01 --nodata 65535
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from PathEngine import INF
+from PathWeighted import CostGrid, dial
+
+
+def load_heights(path, shape=None, dtype="uint16"):
+    """(rows, cols) array of heights from a PNG, .npy or raw file.
+
+    Raw files have no header, so they need the shape and dtype. Colour PNGs are averaged over the RGB channels,
+    pygame reads every image as 8 bits a channel.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        heights = np.load(path, mmap_mode="r")
+    elif extension == ".png":
+        import pygame
+        pixels = pygame.surfarray.array3d(pygame.image.load(path))  # (x, y, channel)
+        heights = pixels.mean(axis=2).T
+    else:
+        if shape is None:
+            raise ValueError("The shape of the raw file %s is needed" % path)
+        heights = np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+
+    if heights.ndim != 2:
+        raise ValueError("%s has shape %s, a 2D heightmap is needed" % (path, heights.shape))
+    return heights
+
+
+class TerrainCosts:
+    """Read only view of a heightmap as costs z + 1, where z = round(height * scale) and below 0 counts as 0.
+
+    Heights equal to nodata are barriers. Slicing by rows converts just those rows.
+    """
+
+    def __init__(self, heights, scale=1.0, nodata=None):
+        self.heights = heights
+        self.scale = scale
+        self.nodata = nodata
+        self.shape = heights.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        block = np.asarray(self.heights[rows], dtype=float)
+        costs = np.maximum(np.round(block * self.scale), 0) + 1
+        if self.nodata is not None:
+            costs[block == self.nodata] = INF
+        return costs
+
+
+def load_cost_grid(path, shape=None, dtype="uint16", scale=1.0, nodata=None, block_rows=256):
+    """CostGrid of a heightmap file, read block_rows rows at a time."""
+    return CostGrid(TerrainCosts(load_heights(path, shape, dtype), scale, nodata), block_rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load a heightmap and search it corner to corner.")
+    parser.add_argument("path", help="PNG, .npy or raw heightmap")
+    parser.add_argument("--shape", type=int, nargs=2, help="Rows and columns of a raw file")
+    parser.add_argument("--dtype", default="uint16", help="Element type of a raw file")
+    parser.add_argument("--scale", type=float, default=1.0, help="z is the height times scale")
+    parser.add_argument("--nodata", type=float, help="Height that marks a barrier")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    start = time.perf_counter()
+    grid = load_cost_grid(args.path, args.shape, args.dtype, args.scale, args.nodata)
+    print("Loaded %d x %d cells, costs %d to %d, in %.2f s"
+          % (grid.rows, grid.cols, grid.min_cost, grid.max_cost, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    result = dial(grid, (0, 0), (grid.rows - 1, grid.cols - 1))
+    print("Searched in %.2f s %s" % (time.perf_counter() - start, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+# Shortest paths on 4-connected grids with whole number cell costs, such as the z + 1 terrain of
+# PathFinderVertical. Moving into a cell costs costs[row][col]; cells with a cost that is 0 or less, or not
+# finite, are barriers.
+#
+# With costs between m and C and the heuristic m * Manhattan distance, a node pushed while expanding a node with
+# f = F has an f between F and F + C + m. The open set can then be a ring of C + m + 1 buckets indexed by f
+# (Dial's algorithm), where every push and pop is O(1) instead of the O(log n) of a heap.
+#
+# Example:
+#   python PathWeighted.py --costs terrain.npy
+
+import argparse
+import heapq
+import time
+
+import numpy as np
+
+from PathEngine import INF, SearchResult, reconstruct_path
+
+
+class CostGrid:
+    """A rows x cols grid of cell costs, padded with a border of barriers and stored as a flat list of ints.
+
+    A cost of 0 in cost marks a barrier. costs can be anything that slices by rows into arrays, such as a
+    memory mapped array or a PathTerrain.TerrainCosts, and is read block_rows rows at a time. The list itself
+    is the whole grid, 8 bytes a cell, kept as a list because the searches index it one cell at a time.
+    """
+
+    def __init__(self, costs, block_rows=256):
+        self.rows, self.cols = np.shape(costs)
+        self.width = self.cols + 2
+
+        # The heuristic is min_cost * Manhattan distance, which only stays admissible while no cell is cheaper
+        self.min_cost = self.max_cost = None
+        self.cost = [0] * self.width
+        for first in range(0, self.rows, block_rows):
+            block = np.asarray(costs[first:first + block_rows], dtype=float)
+            usable = np.isfinite(block) & (block > 0)
+            if (block[usable] != np.round(block[usable])).any():
+                raise ValueError("Cell costs must be whole numbers")
+
+            padded = np.zeros((len(block), self.width), dtype=np.int64)
+            padded[:, 1:-1] = np.where(usable, block, 0)
+            self.cost += padded.ravel().tolist()
+            if usable.any():
+                low = int(block[usable].min())
+                high = int(block[usable].max())
+                self.min_cost = low if self.min_cost is None else min(self.min_cost, low)
+                self.max_cost = high if self.max_cost is None else max(self.max_cost, high)
+        self.cost += [0] * self.width
+
+        self.size = len(self.cost)
+        self.offsets = (self.width, -self.width, 1, -1)  # DOWN, UP, RIGHT, LEFT
+        if self.min_cost is None:
+            self.min_cost = self.max_cost = 1
+
+    def node(self, pos):
+        row, col = pos
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            raise ValueError("%s is outside the %d x %d grid" % (pos, self.rows, self.cols))
+        return (row + 1) * self.width + col + 1
+
+    def pos(self, node):
+        row, col = divmod(node, self.width)
+        return row - 1, col - 1
+
+    def is_barrier(self, pos):
+        return not self.cost[self.node(pos)]
+
+    def set_cost(self, pos, cost):
+        """Changes the cost of a cell, 0 (or inf) makes it a barrier."""
+        cost = int(cost) if np.isfinite(cost) and cost > 0 else 0
+        self.cost[self.node(pos)] = cost
+        if cost:
+            self.min_cost = min(self.min_cost, cost)
+            self.max_cost = max(self.max_cost, cost)
+
+
+def load_costs(path):
+    """Memory maps a cost map saved with np.save."""
+    return np.load(path, mmap_mode="r")
+
+
+def dial(grid, start, end, on_open=None, on_close=None):
+    """A* over a CostGrid with a ring of buckets for the open set.
+
+    Inside a bucket the last node pushed is expanded first, which favours the nodes furthest along. The hooks
+    are the same as PathEngine.astar.
+    """
+    s = grid.node(start)
+    t = grid.node(end)
+    if not grid.cost[s] or not grid.cost[t]:
+        return SearchResult(None, INF, 0, 0, 0)
+
+    width = grid.width
+    cost = grid.cost
+    offsets = grid.offsets
+    scale = grid.min_cost
+    end_row, end_col = divmod(t, width)
+
+    g = [INF] * grid.size
+    came_from = [-1] * grid.size
+    closed = bytearray(grid.size)
+
+    ring = grid.max_cost + scale + 1
+    buckets = [[] for _ in range(ring)]
+    row, col = divmod(s, width)
+    f = scale * (abs(row - end_row) + abs(col - end_col))
+    g[s] = 0
+    buckets[f % ring].append(s)
+    size = 1  # Entries in the buckets, including stale ones
+    pushes = 1
+    max_open = 1
+    expansions = 0
+
+    while size:
+        bucket = buckets[f % ring]
+        while not bucket:
+            f += 1
+            bucket = buckets[f % ring]
+        current = bucket.pop()
+        size -= 1
+        if closed[current]:
+            continue
+        closed[current] = 1
+        expansions += 1
+        if on_close is not None:
+            on_close(grid.pos(current))
+
+        if current == t:
+            return SearchResult(reconstruct_path(grid, came_from, t), g[t], expansions, pushes, max_open)
+
+        g_current = g[current]
+        for d in offsets:
+            neighbour = current + d
+            step = cost[neighbour]
+            if not step or closed[neighbour]:
+                continue
+            temp_g_score = g_current + step
+            if temp_g_score >= g[neighbour]:
+                continue
+
+            if on_open is not None and g[neighbour] == INF:
+                on_open(grid.pos(neighbour))
+            g[neighbour] = temp_g_score
+            came_from[neighbour] = current
+            row, col = divmod(neighbour, width)
+            buckets[(temp_g_score + scale * (abs(row - end_row) + abs(col - end_col))) % ring].append(neighbour)
+            size += 1
+            pushes += 1
+
+        if size > max_open:
+            max_open = size
+
+    return SearchResult(None, INF, expansions, pushes, max_open)
+
+
+def weighted_astar(grid, start, end, on_open=None, on_close=None):
+    """The same search as dial with a heapq of (f, h, node) for the open set."""
+    s = grid.node(start)
+    t = grid.node(end)
+    if not grid.cost[s] or not grid.cost[t]:
+        return SearchResult(None, INF, 0, 0, 0)
+
+    width = grid.width
+    cost = grid.cost
+    offsets = grid.offsets
+    scale = grid.min_cost
+    end_row, end_col = divmod(t, width)
+
+    g = [INF] * grid.size
+    came_from = [-1] * grid.size
+    closed = bytearray(grid.size)
+
+    row, col = divmod(s, width)
+    h = scale * (abs(row - end_row) + abs(col - end_col))
+    g[s] = 0
+    open_set = [(h, h, s)]
+    pushes = 1
+    max_open = 1
+    expansions = 0
+
+    while open_set:
+        _, _, current = heapq.heappop(open_set)
+        if closed[current]:
+            continue
+        closed[current] = 1
+        expansions += 1
+        if on_close is not None:
+            on_close(grid.pos(current))
+
+        if current == t:
+            return SearchResult(reconstruct_path(grid, came_from, t), g[t], expansions, pushes, max_open)
+
+        g_current = g[current]
+        for d in offsets:
+            neighbour = current + d
+            step = cost[neighbour]
+            if not step or closed[neighbour]:
+                continue
+            temp_g_score = g_current + step
+            if temp_g_score >= g[neighbour]:
+                continue
+
+            if on_open is not None and g[neighbour] == INF:
+                on_open(grid.pos(neighbour))
+            g[neighbour] = temp_g_score
+            came_from[neighbour] = current
+            row, col = divmod(neighbour, width)
+            h = scale * (abs(row - end_row) + abs(col - end_col))
+            heapq.heappush(open_set, (temp_g_score + h, h, neighbour))
+            pushes += 1
+
+        if len(open_set) > max_open:
+            max_open = len(open_set)
+
+    return SearchResult(None, INF, expansions, pushes, max_open)
+
+
+WEIGHTED_SEARCHES = {"dial": dial, "heap": weighted_astar}
+
+
+def random_terrain(size, max_z, rng):
+    """Random terrain of 10 x 10 plateaus with costs z + 1, z between 0 and max_z, like PathFinderVertical."""
+    noise = rng.random((size // 10 + 2, size // 10 + 2))
+    coarse = np.kron(noise, np.ones((10, 10)))[:size, :size]
+    return np.round(coarse * max_z).astype(np.int64) + 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the bucket and heap searches on a weighted grid.")
+    parser.add_argument("--costs", help="Cost map saved with np.save, otherwise a random terrain is used")
+    parser.add_argument("--size", type=int, default=1000, help="Rows and columns of the random terrain")
+    parser.add_argument("--max-z", type=int, default=9, help="Highest z of the random terrain")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.costs is not None:
+        costs = load_costs(args.costs)
+    else:
+        costs = random_terrain(args.size, args.max_z, np.random.default_rng(args.seed))
+
+    grid = CostGrid(costs)
+    start = (0, 0)
+    end = (grid.rows - 1, grid.cols - 1)
+    for name, search in WEIGHTED_SEARCHES.items():
+        begin = time.perf_counter()
+        result = search(grid, start, end)
+        print("%-5s %.3f s %s" % (name, time.perf_counter() - begin, result))
+
+
+if __name__ == '__main__':
+    main()
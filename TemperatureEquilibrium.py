@@ -1,153 +1,146 @@
-# This simulation takes a qrid of length n by n and randomly initiates a temperature to each node.
-# Over incremental time steps, each node will tend to the average value of the 4 nodes closest to it.
+# This simulation takes a cube of n by n by n nodes and randomly initiates a temperature to each node.
+# Over incremental time steps, each node will tend to the average value of the (up to 6) nodes closest to it.
 # The simulations stops once a global temperature difference is below a tolerance.
+# The nodes are updated by HeatEngine, or split over several processes by HeatParallel, the window shows the
+# layer z = 0.
+#
+# Example:
+#   python TemperatureEquilibrium.py 200
+#   python TemperatureEquilibrium.py 400 8    (8 worker processes)
+#   python TemperatureEquilibrium.py 100 1 run    (recorded to run.npy and run_stats.npy, see HeatRecorder)
 
+import sys
 
-import random
 import pygame
-import time
+import numpy as np
+
+from DoubleBuffer import DoubleBuffer, SimulationThread
+from HeatEngine import HeatEngine
+from HeatParallel import ParallelHeatEngine
+from HeatRecorder import HeatRecorder, initial_stats
 
 white = (255, 255, 255)
 black = (0, 0, 0)
 blue = (0, 0, 255)
 
-
-class Node:
-    def __init__(self):
-        self.temperature = random.randint(0, 255)  # [K]
-
-
-def animation(matrix, n, time):
-    # Initialise variables
-    atom_size = 10  # Radius
-    w = 600
-    h = 600
-    spacing = atom_size*4  # 1 Diameter spacing
-    padding = (w - (n*atom_size*2 + (n-1)*(spacing-(2*atom_size))))/2
-
-    highest_temp = 0
-    lowest_temp = 255
-
-    pygame.init()
-    game_display = pygame.display.set_mode((w, h))
-    game_display.fill(black)
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            quit()
-
-    # Draw nodes
-    for y in range(n):
-        for x in range(n):
-            if matrix[0][y][x].temperature > 100:
-                colour = (matrix[0][y][x].temperature, 0, 0)
-            else:
-                colour = (0, 0, 255-matrix[0][y][x].temperature)
-
-            if matrix[0][y][x].temperature > highest_temp:
-                highest_temp = matrix[0][y][x].temperature
-            elif matrix[0][y][x].temperature < lowest_temp:
-                lowest_temp = matrix[0][y][x].temperature
-
-            pygame.draw.circle(game_display, colour, (padding + x*spacing, padding + y*spacing), atom_size)
-            my_font = pygame.font.SysFont('arial', 12)
-            temp_int = int(matrix[0][y][x].temperature)
-            text_surface = my_font.render(str(temp_int), False, white)
-            game_display.blit(text_surface, (padding + x*spacing - 8, padding + y*spacing - 8))
-
-    # Print time
-    my_font = pygame.font.SysFont('arial', 15)
-    text_surface = my_font.render('Time: ' + str(time), False, white)
-    game_display.blit(text_surface, (w/2, 10))
-
-    if highest_temp - lowest_temp < 10:
-        # We have reached thermal equilibrium and stop
-        pygame.quit()
-        quit()
-
-
-def main():
+W = 600
+FPS = 60
+TOLERANCE = 10  # Equilibrium once the highest and lowest temperatures are this close
+RECORD_EVERY = 10  # Steps between recorded snapshots
+
+
+class HeatRenderer:
+    """Draws one z layer of temperatures as a heatmap, with the temperature written on each node if it fits.
+
+    The display, fonts and colour map are made once. The layer goes through a surface with one pixel per node,
+    coloured with the palette by surfarray and scaled up onto the window. The text of each whole temperature
+    from 0 to 255 is only rendered the first time it is needed.
+    """
+
+    def __init__(self, win, n, width, label_size=24):
+        self.win = win
+        self.n = n
+        self.cell = max(1, (width - 60) // n)  # Room for the time above the grid
+        self.padding = ((width - n*self.cell) // 2, 40)
+        self.surface = pygame.Surface((n, n))
+        self.show_labels = self.cell >= label_size
+
+        # Hot nodes (above 100) red, cold ones blue
+        t = np.arange(256)
+        self.palette = np.zeros((256, 3), dtype=np.uint8)
+        self.palette[:, 0] = np.where(t > 100, t, 0)
+        self.palette[:, 2] = np.where(t > 100, 0, 255 - t)
+
+        self.label_font = pygame.font.SysFont('arial', 12)
+        self.time_font = pygame.font.SysFont('arial', 15)
+        self.glyphs = {}
+
+    def glyph(self, temperature):
+        if temperature not in self.glyphs:
+            self.glyphs[temperature] = self.label_font.render(str(temperature), False, white)
+        return self.glyphs[temperature]
+
+    def draw(self, layer, time):
+        levels = np.clip(layer, 0, 255).astype(np.uint8)
+        # surfarray indexes pixels [x][y], so the layer is transposed from [y][x]
+        pygame.surfarray.blit_array(self.surface, self.palette[levels.T])
+
+        size = self.n * self.cell
+        self.win.fill(black)
+        self.win.blit(pygame.transform.scale(self.surface, (size, size)), self.padding)
+
+        if self.show_labels:
+            left, top = self.padding
+            for y, row in enumerate(levels.tolist()):
+                for x, temperature in enumerate(row):
+                    label = self.glyph(temperature)
+                    self.win.blit(label, label.get_rect(center=(left + (x + 0.5)*self.cell,
+                                                                top + (y + 0.5)*self.cell)))
+
+        text_surface = self.time_font.render('Time: ' + str(time), False, white)
+        self.win.blit(text_surface, (self.win.get_width()/2, 10))
+
+
+def main(n=5, workers=1, record=None):
     # Define an empty cube matrix of order n.
     # matrix[z][y][x].
-    n = 5
-    matrix = [[[Node() for x in range(n)] for x in range(n)] for x in range(n)]
-    t = 0
+    engine = HeatEngine((n, n, n)) if workers == 1 else ParallelHeatEngine((n, n, n), workers)
     time_step = 1
 
-    animation(matrix, n, t)
+    recorder = None
+    if record is not None:
+        recorder = HeatRecorder(record, (n, n, n), RECORD_EVERY)
+        recorder.record(0, engine.temperatures, initial_stats(engine.temperatures))
+
+    # The nodes are updated on a worker thread, which publishes a copy of the drawn layer and the time after
+    # every step. The window draws the latest copy at a capped frame rate.
+    def step():
+        if engine.spread() < TOLERANCE:
+            # Thermal equilibrium, the last state is published when the thread finishes
+            return False
+        stats = engine.step(stats=recorder is not None)
+        if recorder is not None:
+            recorder.record(engine.time, engine.temperatures, stats[0])
+
+    def write(snapshot):
+        snapshot["layer"][...] = engine.layer(0)
+        snapshot["time"] = engine.time * time_step
+
+    buffer = DoubleBuffer({"layer": np.zeros((n, n)), "time": 0},
+                          {"layer": np.zeros((n, n)), "time": 0}, interval=1 / FPS)
+    buffer.publish(write)
+    worker = SimulationThread(step, write, buffer)
+    worker.start()
 
-    # Running window
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+    pygame.init()
+    win = pygame.display.set_mode((W, W))
+    renderer = HeatRenderer(win, n, W)
+    clock = pygame.time.Clock()
+
+    # Running window, until the worker has reached equilibrium and its last state has been drawn
+    try:
+        while True:
+            finished = not worker.is_alive()
+            with buffer.front() as snapshot:
+                renderer.draw(snapshot["layer"], snapshot["time"])
+            pygame.display.update()
+            clock.tick(FPS)
+            if finished:
                 pygame.quit()
                 quit()
-            animation(matrix, n, t)
-            pygame.display.update()
-            time.sleep(time_step)
-            matrix = update_nodes(matrix, n)
-            t += time_step
-
-        pygame.display.update()
-
-
-def update_nodes(matrix, n):
-    # Create a copy of matrix which will store temperature at t = t + dt
-    # Loop through every node in the matrix [z=0]
-    # for each node calculate the average surrounding temperature and use that with the the current node temperature
-    # to calculate the new note temperature at t = t + dt. Return the new matrix.
-
-    matrix2 = [[[Node() for x in range(n)] for x in range(n)] for x in range(n)]
-
-    for y in range(n):
-        for x in range(n):
-            cumulative_temp = 0
-            nodes_checked = 0
-            # Check for boundaries
-            if x == 0:
-                if y == 0:
-                    cumulative_temp = matrix[0][y][x + 1].temperature + matrix[0][y + 1][x].temperature
-                    nodes_checked = 2
-                elif y == n - 1:
-                    cumulative_temp = matrix[0][y][x + 1].temperature + matrix[0][y - 1][x].temperature
-                    nodes_checked = 2
-                else:
-                    cumulative_temp = matrix[0][y][x + 1].temperature + matrix[0][y - 1][x].temperature + \
-                                      matrix[0][y + 1][x].temperature
-                    nodes_checked = 3
-            elif x == n - 1:
-                if y == 0:
-                    cumulative_temp = matrix[0][y][x - 1].temperature + matrix[0][y + 1][x].temperature
-                    nodes_checked = 2
-                elif y == n - 1:
-                    cumulative_temp = matrix[0][y][x - 1].temperature + matrix[0][y - 1][x].temperature
-                    nodes_checked = 2
-                else:
-                    cumulative_temp = matrix[0][y][x - 1].temperature + matrix[0][y - 1][x].temperature + \
-                                      matrix[0][y + 1][x].temperature
-                    nodes_checked = 3
-            elif y == 0:
-                cumulative_temp = matrix[0][y][x - 1].temperature + matrix[0][y][x + 1].temperature + \
-                                  matrix[0][y + 1][x].temperature
-                nodes_checked = 3
-            elif y == n - 1:
-                cumulative_temp = matrix[0][y][x - 1].temperature + matrix[0][y][x + 1].temperature + \
-                                  matrix[0][y - 1][x].temperature
-                nodes_checked = 3
-            else:
-                # Node is central node
-                cumulative_temp = matrix[0][y][x + 1].temperature + matrix[0][y][x - 1].temperature + \
-                                    matrix[0][y + 1][x].temperature + matrix[0][y - 1][x].temperature
-                nodes_checked = 4
-
-            average_temperature = cumulative_temp/nodes_checked
-            average_average_temperature = (average_temperature + matrix[0][y][x].temperature)/2
-
-            matrix2[0][y][x].temperature = average_average_temperature
-
-    return matrix2
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    worker.stop()
+                    pygame.quit()
+                    quit()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if workers != 1:
+            engine.close()
 
 
 if __name__ == '__main__':
-    main()
+    # Nodes along each side (5 by default), worker processes (1 by default) and where to record the run (if at all)
+    main(*[int(arg) for arg in sys.argv[1:3]], *sys.argv[3:4])